@@ -0,0 +1,148 @@
+"""
+Exact endgame solver.
+
+Once few playable cells remain, the game tree is small enough to search to
+the end. `solve` runs a negamax alpha-beta search over the results win (1),
+draw (0) and loss (-1) for the player to move, with its own transposition
+table keyed by Game.position_hash(). Within each position it tries the
+table's best move first, then moves that win their mini-board, and a move
+that wins the game cuts the search at once.
+
+The search has a node and time budget. When the budget runs out, the result
+is unknown and the caller searches as usual.
+"""
+import time
+
+from core.bitboard import CELL_BITS, EMPTY_CELLS, HAS_LINE
+from config import SOLVER_NODE_LIMIT, SOLVER_TABLE_SIZE
+
+WIN, DRAW, LOSS = 1, 0, -1
+RESULT_NAMES = {WIN: "win", DRAW: "draw", LOSS: "loss"}
+EXACT, LOWER, UPPER = 0, 1, 2  # transposition table bound types
+CHECK_EVERY = 1024  # nodes between time checks
+
+
+class Solution:
+    """Outcome of one solve: `result` for the player to move (None when out of budget) and a move achieving it."""
+
+    def __init__(self, result, best_move, nodes, seconds):
+        self.result = result
+        self.best_move = best_move
+        self.nodes = nodes
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {
+            "result": RESULT_NAMES.get(self.result),
+            "best_move": self.best_move,
+            "nodes": self.nodes,
+            "time": self.seconds
+        }
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+def playable_cells(game):
+    """Empty cells in mini-boards that are neither won nor full."""
+    board = game.board
+    count = 0
+    for i, mini in enumerate(board.boards):
+        if not board.decided >> i & 1:
+            count += len(EMPTY_CELLS[mini.x | mini.o])
+    return count
+
+
+class EndgameSolver:
+    def __init__(self, node_limit=SOLVER_NODE_LIMIT, table_size=SOLVER_TABLE_SIZE):
+        self.node_limit = node_limit
+        self.table_size = table_size
+        self.table = {}  # position hash -> (value, bound type, best move)
+        self.nodes = 0
+        self.deadline = float("inf")
+
+    def solve(self, game, seconds_limit=float("inf")):
+        """Solve the position of `game` (left untouched) within the node limit and `seconds_limit`."""
+        start_time = time.time()
+        self.nodes = 0
+        self.deadline = start_time + seconds_limit
+        # A search cut short leaves moves on the board, so work on a copy
+        game = game.copy()
+        try:
+            result = self._negamax(game, LOSS, WIN)
+        except _OutOfBudget:
+            return Solution(None, None, self.nodes, time.time() - start_time)
+        best_move = self.table[game.position_hash()][2] if game.legal_moves() else None
+        return Solution(result, best_move, self.nodes, time.time() - start_time)
+
+    def _ordered_moves(self, game, moves, tt_move):
+        mover = game.next_to_move
+        boards = game.board.boards
+        first = []
+        rest = []
+        for m in moves:
+            if m == tt_move:
+                continue
+            mini = boards[m[0]]
+            own = mini.x if mover == "x" else mini.o
+            (first if HAS_LINE[own | CELL_BITS[m[1]]] else rest).append(m)
+        if tt_move is not None:
+            first.insert(0, tt_move)
+        return first + rest
+
+    def _negamax(self, game, alpha, beta):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and (self.nodes >= self.node_limit or time.time() > self.deadline):
+            raise _OutOfBudget()
+
+        # The previous move may have ended the game
+        if game.board.winner:
+            return LOSS
+        moves = game.legal_moves()
+        if not moves:
+            return DRAW
+
+        key = game.position_hash()
+        entry = self.table.get(key)
+        tt_move = None
+        if entry is not None:
+            value, bound, tt_move = entry
+            if bound == EXACT:
+                return value
+            if bound == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        original_alpha = alpha
+        mover = game.next_to_move
+        best = LOSS - 1
+        best_move = None
+        for m in self._ordered_moves(game, moves, tt_move):
+            game.make_move(m[0], m[1], mover)
+            if game.board.winner == mover:
+                value = WIN
+            else:
+                value = -self._negamax(game, -beta, -alpha)
+            game.undo_last_move()
+            if value > best:
+                best = value
+                best_move = m
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        break
+
+        if best <= original_alpha:
+            bound = UPPER
+        elif best >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        if len(self.table) >= self.table_size:
+            self.table.clear()
+        self.table[key] = (best, bound, best_move)
+        return best
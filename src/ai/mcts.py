@@ -1,106 +1,560 @@
 import time
 import math
+import random
+import threading
+from array import array
+from collections import OrderedDict
 from utils.utils import load_agent_config
+from ai.transposition import TranspositionTable
+from ai.time_manager import TimeManager, best_root_move
+from ai.endgame import EndgameSolver, playable_cells, WIN, DRAW
+from ai.node_pool import NodePool, NO_HANDLE, MOVES, move_byte, UNPROVEN, PROVEN_LOSS, PROVEN_DRAW, PROVEN_WIN
+from ai import worker_pool
+from config import SOLVER_EMPTY_CELLS, SOLVER_TIME_SHARE
 
 DEFAULT_SECONDS_LIMIT = 30
 DEFAULT_NODE_LIMIT = 100000
+DEFAULT_TRANSPOSITION_TABLE_SIZE = 2 ** 17
+MAX_PATH_LENGTH = 82  # the root plus one node per cell
+SOLVED_SCORES = {WIN: 1.0, DRAW: 0.5}  # average score reported for a solved move
+PROVEN_NAMES = {PROVEN_LOSS: "loss", PROVEN_DRAW: "draw", PROVEN_WIN: "win"}
+DEFAULT_PROGRESS_INTERVAL = 0.25
+PHASES = ("selection", "expansion", "rollout", "scoring", "backpropagation")
+SELECTION, EXPANSION, ROLLOUT, SCORING, BACKPROPAGATION = range(len(PHASES))
+SEARCH_COUNTERS = ("iterations", "expansions", "rollout_moves", "make_move_calls", "undo_calls", "legal_moves_calls",
+                   "score_calls", "batched_score_calls", "score_cache_hits", "transposition_lookups",
+                   "transposition_hits")
 
 
-class SimulationTreeNode:
-    def __init__(self, game, player, agent_id='default'):
-        self.game = game
-        self.player = player
-        self.number_of_plays = 1
-        self.children = {}
-        self.total_score = 0
-        self.depth_seen = 1
-        self.unseen_children = list(game.legal_moves())
+class SearchTree:
+    """
+    An MCTS tree over a Game, stored in a NodePool and addressed by integer node handles.
+
+    Scores are kept from the perspective of the player to move at the root.
+    The tree can outlive a single evaluate_next_move call: before each search
+    `sync` moves it to the caller's position. When that position is our
+    earlier move followed by the opponent's reply, the matching grandchild
+    becomes the new root and keeps the visits it already has; the rest of the
+    tree is returned to the pool's freelist. A tree that was `advance`d past
+    our move (to ponder on the opponent's turn) is re-rooted on the reply
+    alone. Anything else restarts from an empty tree.
+
+    Without a seed the search is fully deterministic. A seeded tree expands
+    unexplored moves in a seed-dependent order and plays a random move with
+    probability `rollout_epsilon` during rollouts, so trees searched with
+    different seeds explore differently.
+
+    Finished games are proven wins, losses or draws, and proofs back up by
+    minimax (MCTS-Solver): a node is proven once one child gives the player
+    to move its best outcome, or once every child is proven. Selection skips
+    proven children, and the search ends once the root is proven.
+
+    Each iteration adds the time it spends in every phase to `phase_seconds`
+    and counts its work; `search_stats` reports both since `reset_stats`.
+    Rollout time includes taking the rollout moves back, backpropagation
+    includes taking back the selection moves.
+    """
 
+    def __init__(self, game, agent_id='default', transposition_table_size=DEFAULT_TRANSPOSITION_TABLE_SIZE,
+                 seed=None):
+        self.load_config(agent_id, seed)
+        self.pool = NodePool()
+        self.path = array("i", [NO_HANDLE]) * MAX_PATH_LENGTH  # nodes visited by the current iteration
+        self.transpositions = (TranspositionTable(transposition_table_size, self.pool.visits)
+                               if transposition_table_size > 0 else None)
+        self.reset(game)
+        self.reset_stats()
+
+    def load_config(self, agent_id, seed):
+        self.agent_id = agent_id
         config = load_agent_config(agent_id=agent_id)
         self.ucb_constant = float(config.get("ucb_constant", 1.414))
         self.rollout_depth = int(config.get("rollout_depth", 5))
+        self.rollout_epsilon = float(config.get("rollout_epsilon", 0.1))
+        self.rng = random.Random(seed) if seed is not None else None
+        self.order_offset = self.rng.randrange(81) if self.rng is not None else 0
+
+    def reset(self, game, player=None):
+        """Start an empty tree searching `game` (which the tree then owns).
+
+        Scores are kept for `player`, by default the player to move in `game`.
+        """
+        self.game = game
+        self.player = player or game.next_to_move
+        self.pool.clear()
+        if self.transpositions is not None:
+            self.transpositions.clear()
+        self.root = self.pool.new_node(len(game.legal_moves()), game.position_hash())
+
+    def sync(self, game):
+        """Re-root on the position of `game`. Returns True if existing statistics were kept."""
+        target = game.position_hash()
+        if self.game.position_hash() == target:
+            return True
+
+        if game.move_stack:
+            reply = move_byte(game.move_stack[-1])
+
+            # The opponent's reply, when the tree was advanced past our move to ponder on their turn
+            child = self.pool.child(self.root, reply)
+            if child != NO_HANDLE:
+                self.game.make_move(*MOVES[reply], self.game.next_to_move)
+                if self.game.position_hash() == target:
+                    self.reroot(child)
+                    return True
+                self.game.undo_last_move()
+
+            # Our move followed by the opponent's reply (the last move played in `game`)
+            for m, child in self.pool.children(self.root):
+                grandchild = self.pool.child(child, reply)
+                if grandchild == NO_HANDLE:
+                    continue
+                self.game.make_move(*MOVES[m], self.game.next_to_move)
+                self.game.make_move(*MOVES[reply], self.game.next_to_move)
+                if self.game.position_hash() == target:
+                    self.reroot(grandchild)
+                    return True
+                self.game.undo_last_move()
+                self.game.undo_last_move()
+
+        self.reset(game.copy())
+        return False
+
+    def advance(self, move):
+        """Play `move` at the root and keep searching from there, still scoring for the same player.
+
+        Used to ponder on the opponent's turn after our move. The subtree below
+        `move` is kept when it was expanded.
+        """
+        child = self.pool.child(self.root, move_byte(move))
+        self.game.make_move(move[0], move[1], self.game.next_to_move)
+        if child == NO_HANDLE:
+            self.reset(self.game, player=self.player)
+        else:
+            self.reroot(child)
+
+    def reroot(self, node):
+        """Make `node` (whose position self.game is now in) the root, freeing the rest of the tree."""
+        self.root = node
+        reachable = self.pool.retain(node)
+        if self.transpositions is not None:
+            # Re-index only the positions still reachable from the new root
+            self.transpositions.clear()
+            for n in reachable:
+                self.transpositions.store(self.pool.key[n], n)
+
+    def reset_stats(self):
+        """Zero the phase timers and counters reported by search_stats, the game's and evaluators' included."""
+        self.phase_seconds = [0.0] * len(PHASES)
+        self.iterations = 0
+        self.expansions = 0
+        self.rollout_moves = 0
+        game = self.game
+        game.make_move_calls = game.undo_calls = game.legal_moves_calls = game.batched_score_calls = 0
+        for evaluator in game.board.evaluators.values():
+            evaluator.calls = evaluator.cache_hits = 0
+        if self.transpositions is not None:
+            self.transpositions.reset_stats()
+
+    def search_stats(self):
+        """Seconds per phase and the SEARCH_COUNTERS since the last reset_stats."""
+        game = self.game
+        evaluators = game.board.evaluators.values()
+        transpositions = self.transpositions
+        return {
+            "phase_seconds": dict(zip(PHASES, self.phase_seconds)),
+            "iterations": self.iterations,
+            "expansions": self.expansions,
+            "rollout_moves": self.rollout_moves,
+            "make_move_calls": game.make_move_calls,
+            "undo_calls": game.undo_calls,
+            "legal_moves_calls": game.legal_moves_calls,
+            # Batched rollout scores skip the evaluators but are scoring work all the same
+            "score_calls": sum(evaluator.calls for evaluator in evaluators) + game.batched_score_calls,
+            "batched_score_calls": game.batched_score_calls,
+            "score_cache_hits": sum(evaluator.cache_hits for evaluator in evaluators),
+            "transposition_lookups": transpositions.lookups if transpositions is not None else 0,
+            "transposition_hits": transpositions.hits if transpositions is not None else 0
+        }
 
-    def get_score_of_move(self, m):
-        if m not in self.children:
+    def get_score_of_move(self, node, m):
+        child = self.pool.child(node, move_byte(m))
+        if child == NO_HANDLE:
             print("{} is not a move from this state".format(m))
             return
-        return float(self.children[m].total_score) / float(self.children[m].number_of_plays)
+        return float(self.pool.value[child]) / float(self.pool.visits[child])
+
+    def get_children(self, node):
+        """(move, child) pairs in the order they were expanded."""
+        return [(MOVES[m], c) for m, c in self.pool.children(node)][::-1]
+
+    def root_statistics(self):
+        """(move, visits, value sum) for each child of the root, in the order they were expanded."""
+        return [(m, self.pool.visits[c], self.pool.value[c]) for m, c in self.get_children(self.root)]
+
+    def principal_variation(self):
+        """The moves expected from the root on: the most visited child at each level."""
+        pool = self.pool
+        variation = []
+        node = self.root
+        while len(variation) < MAX_PATH_LENGTH - 1:
+            best_child = NO_HANDLE
+            best_move = None
+            best_visits = 0
+            for m, c in pool.children(node):
+                if pool.visits[c] > best_visits:
+                    best_visits = pool.visits[c]
+                    best_child = c
+                    best_move = m
+            if best_child == NO_HANDLE:
+                break
+            variation.append(MOVES[best_move])
+            node = best_child
+        return variation
+
+    def root_proofs(self):
+        """{move: PROVEN_*} for the root's proven children."""
+        pool = self.pool
+        return {MOVES[m]: pool.proven[c] for m, c in pool.children(self.root) if pool.proven[c] != UNPROVEN}
 
-    def get_best_action_by_average_score(self):
+    def prove(self, node, player_to_move):
+        """Settle `node` from its children by minimax if they allow it. Returns True if `node` is proven."""
+        pool = self.pool
+        proven = pool.proven
+        best = PROVEN_WIN if player_to_move else PROVEN_LOSS
+        result = PROVEN_LOSS if player_to_move else PROVEN_WIN
+        all_proven = pool.unseen[node] == 0
+        for _, c in pool.children(node):
+            p = proven[c]
+            if p == best:
+                proven[node] = p
+                return True
+            if p == UNPROVEN:
+                all_proven = False
+            elif player_to_move:
+                result = max(result, p)
+            else:
+                result = min(result, p)
+        if all_proven:
+            proven[node] = result
+        return all_proven
+
+    def get_best_action_by_average_score(self, node):
+        # Children come newest first, so a strict comparison keeps the latest
+        # expanded move on ties
+        pool = self.pool
         action = None
         best_score = -float("inf")
-        for m, c in self.children.items():
-            score = c.total_score / float(c.number_of_plays)
-            if score >= best_score:
+        for m, c in pool.children(node):
+            score = pool.value[c] / float(pool.visits[c])
+            if score > best_score:
                 best_score = score
-                action = m
+                action = MOVES[m]
         return action
 
-    def get_best_action_by_ucb1(self, C):
-        action = None
+    def get_best_action_by_ucb1(self, node, C):
+        pool = self.pool
+        visits = pool.visits
+        value = pool.value
+        edge_child = pool.edge_child
+        edge_next = pool.edge_next
+        # The parent's log term is the same for every child
+        proven = pool.proven
+        scale = 2 * C
+        log_plays = 2 * math.log(visits[node])
+        action = NO_HANDLE
         best_score = -float("inf")
-        for m, c in self.children.items():
-            exploit = c.total_score / float(c.number_of_plays)
-            explore = 2 * C * math.sqrt(2 * math.log(self.number_of_plays) / float(c.number_of_plays))
-            ucb = exploit + explore
-            if ucb >= best_score:
+        edge = pool.first_edge[node]
+        while edge != NO_HANDLE:
+            c = edge_child[edge]
+            # Proven children need no more visits
+            if proven[c] != UNPROVEN:
+                edge = edge_next[edge]
+                continue
+            plays = float(visits[c])
+            ucb = value[c] / plays + scale * math.sqrt(log_plays / plays)
+            if ucb > best_score:
                 best_score = ucb
-                action = m
+                action = pool.edge_move[edge]
+            edge = edge_next[edge]
         return action
 
-    def expand_one_child(self, game_path=[]):
-        if len(self.unseen_children) == 0:
-            return
+    def expand_one_child(self, node):
+        """Add one unexplored child below `node`, roll out from it and return the rollout score."""
+        pool = self.pool
+        game = self.game
+        clock = time.perf_counter
+        start = clock()
+        self.expansions += 1
 
         # Get move to try
-        m = self.unseen_children.pop()
-        moves_made = []
+        pool.unseen[node] -= 1
+        legal_moves = game.legal_moves()
+        m = legal_moves[(pool.unseen[node] + self.order_offset) % len(legal_moves)]
 
         # Make the move
-        self.game.make_move(m[0], m[1], self.game.next_to_move)
-        moves_made.append(m)
+        game.make_move(m[0], m[1], game.next_to_move)
+        moves_made = 1
 
-        # Create child node
-        self.children[m] = SimulationTreeNode(self.game, self.player)
+        # Create child node, sharing it with any transposition of the same position
+        key = game.position_hash()
+        child = self.transpositions.lookup(key) if self.transpositions is not None else NO_HANDLE
+        shared = child != NO_HANDLE
+        if not shared:
+            child = pool.new_node(len(game.legal_moves()), key)
+            if self.transpositions is not None:
+                self.transpositions.store(key, child)
+            if game.board.winner:
+                pool.proven[child] = PROVEN_WIN if game.board.winner == self.player else PROVEN_LOSS
+            elif pool.unseen[child] == 0:
+                pool.proven[child] = PROVEN_DRAW
+        pool.add_child(node, move_byte(m), child)
 
         # Run quick simulation
+        rollout_start = clock()
         depth = 0
-        while depth < self.rollout_depth and not self.game.board.winner and self.game.legal_moves():
-            greedy_move = self.game.greedy_next_move()
+        while depth < self.rollout_depth and not game.board.winner and game.legal_moves():
+            if self.rng is not None and self.rng.random() < self.rollout_epsilon:
+                legal_moves = game.legal_moves()
+                greedy_move = legal_moves[self.rng.randrange(len(legal_moves))]
+            else:
+                greedy_move = game.greedy_next_move()
             if not greedy_move:
                 break
-            self.game.make_move(greedy_move[0], greedy_move[1], self.game.next_to_move)
-            moves_made.append(greedy_move)
+            game.make_move(greedy_move[0], greedy_move[1], game.next_to_move)
+            moves_made += 1
             depth += 1
 
         # Get score at this depth
-        score = self.game.board.score(self.player)
-        self.children[m].total_score = score
-
-        # Backpropagate
-        for node in game_path:
-            node.number_of_plays += 1
-            node.total_score += score
-            if len(game_path) > node.depth_seen:
-                node.depth_seen = len(game_path)
+        scoring_start = clock()
+        score = game.board.score(self.player)
+        scored = clock()
+        if shared:
+            pool.visits[child] += 1
+        pool.value[child] += score
 
         # Undo all moves
-        for _ in range(len(moves_made)):
-            self.game.undo_last_move()
+        for _ in range(moves_made):
+            game.undo_last_move()
+
+        phase_seconds = self.phase_seconds
+        phase_seconds[EXPANSION] += rollout_start - start
+        phase_seconds[ROLLOUT] += scoring_start - rollout_start + clock() - scored
+        phase_seconds[SCORING] += scored - scoring_start
+        self.rollout_moves += depth
+        return score
 
-    def expand_tree_by_one(self, game_path=[]):
-        if len(self.unseen_children) != 0:
-            self.expand_one_child(game_path=game_path)
+    def expand_tree_by_one(self, node):
+        """One MCTS iteration below `node`: select a leaf, expand one child, roll out and back up."""
+        pool = self.pool
+        game = self.game
+        path = self.path
+        unseen = pool.unseen
+        first_edge = pool.first_edge
+        clock = time.perf_counter
+        phase_seconds = self.phase_seconds
+        start = clock()
+        self.iterations += 1
+
+        # Selection, recording the nodes we pass through
+        length = 0
+        while unseen[node] == 0 and first_edge[node] != NO_HANDLE:
+            # TODO: Consider some sort of UCB constant schedule
+            m = self.get_best_action_by_ucb1(node, self.ucb_constant)
+            if m == NO_HANDLE:
+                break  # every child was proven through a transposition
+            path[length] = node
+            length += 1
+            game.make_move(*MOVES[m], game.next_to_move)
+            node = pool.child(node, m)
+        path[length] = node
+        length += 1
+        selected = clock()
+        phase_seconds[SELECTION] += selected - start
+
+        # Expansion and simulation, timed by expand_one_child; a finished game is scored as it stands
+        if unseen[node] != 0:
+            score = self.expand_one_child(node)
+            settled = pool.proven[pool.edge_child[first_edge[node]]] != UNPROVEN
+        elif first_edge[node] != NO_HANDLE:
+            score = None
+            settled = True
         else:
-            if len(self.children) > 0:
-                m = self.get_best_action_by_ucb1(self.ucb_constant)
-                # Make move
-                self.game.make_move(m[0], m[1], self.game.next_to_move)
-                # Expand child
-                # TODO: Consider some sort of UCB constant schedule
-                self.children[m].expand_tree_by_one(game_path=game_path + [self])
-                # Undo move
-                self.game.undo_last_move()
+            score = game.board.score(self.player)
+            settled = False
+            phase_seconds[SCORING] += clock() - selected
+        backup_start = clock()
+
+        # Back up proofs from the leaf for as long as they settle the next node up
+        if settled:
+            player_to_move = game.next_to_move == self.player
+            for i in range(length - 1, -1, -1):
+                if not self.prove(path[i], player_to_move):
+                    break
+                player_to_move = not player_to_move
+        if score is None:
+            score = pool.value[node] / float(pool.visits[node])
+
+        # Backpropagate through every node on the path, the expanded one included.
+        # Depth counts from each node itself, so it stays right after the root moves on
+        visits = pool.visits
+        value = pool.value
+        depth = pool.depth
+        for i in range(length):
+            n = path[i]
+            visits[n] += 1
+            value[n] += score
+            if length - i > depth[n]:
+                depth[n] = length - i
+
+        # Undo the selection moves
+        for _ in range(length - 1):
+            game.undo_last_move()
+        phase_seconds[BACKPROPAGATION] += clock() - backup_start
+
+
+class SearchTreeCache:
+    """
+    Bounded cache of SearchTrees keyed by game id, evicting the least recently used.
+    `take` removes the tree so two concurrent requests never search the same tree.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.trees = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, game_id):
+        with self.lock:
+            return self.trees.pop(game_id, None)
+
+    def put(self, game_id, tree):
+        with self.lock:
+            self.trees[game_id] = tree
+            self.trees.move_to_end(game_id)
+            while len(self.trees) > self.max_size:
+                self.trees.popitem(last=False)
+
+
+class ProgressReporter:
+    """
+    Hands a snapshot of the root to `callback` every `interval` seconds of a search.
+
+    The callback returns True to end the search early ("play now").
+    Called after every iteration, like TimeManager.should_stop.
+    """
+
+    def __init__(self, callback, start_time, interval=DEFAULT_PROGRESS_INTERVAL, reused_gamestates=0):
+        self.callback = callback
+        self.start_time = start_time
+        self.interval = interval
+        self.reused_gamestates = reused_gamestates
+        self.next_report = start_time + interval
+        self.interrupted = False
+
+    def snapshot(self, tree):
+        """Best move, per-move statistics and principal variation of `tree` so far."""
+        pool = tree.pool
+        root_moves = tree.root_statistics()
+        best_move, best_score = best_root_move(root_moves)
+        elapsed = time.time() - self.start_time
+        num_gamestates = pool.visits[tree.root]
+        return {
+            "best_move": best_move,
+            "best_score": best_score if best_move is not None else None,
+            "moves": sorted([(m, value / float(visits), visits) for m, visits, value in root_moves],
+                            key=lambda x: x[2])[::-1],
+            "principal_variation": tree.principal_variation(),
+            "num_gamestates": num_gamestates,
+            "depth_explored": pool.depth[tree.root],
+            "elapsed": elapsed,
+            "nodes_per_second": (num_gamestates - self.reused_gamestates) / elapsed if elapsed > 0 else 0.0
+        }
+
+    def __call__(self, tree):
+        now = time.time()
+        if now < self.next_report:
+            return False
+        self.next_report = now + self.interval
+        if self.callback(self.snapshot(tree)):
+            self.interrupted = True
+        return self.interrupted
+
+
+def search(tree, start_time, seconds_limit, node_limit, time_manager=None, interrupt=None):
+    """Grow `tree` from its root until `seconds_limit` after `start_time`, `node_limit` root visits or a proven
+    root, or until `time_manager` (if given) decides to stop or `interrupt(tree)` returns True.
+    """
+    node = tree.root
+    pool = tree.pool
+    proven = pool.proven
+    while (time.time() - start_time <= seconds_limit) and (pool.visits[node] < node_limit) and proven[node] == UNPROVEN:
+        tree.expand_tree_by_one(node)
+        if time_manager is not None and time_manager.should_stop(tree):
+            break
+        if interrupt is not None and interrupt(tree):
+            break
+
+
+def search_result(tree):
+    """Root statistics and proofs of a searched tree, as merged by evaluate_next_move."""
+    pool = tree.pool
+    return {
+        "moves": tree.root_statistics(),
+        "num_gamestates": pool.visits[tree.root],
+        "depth_explored": pool.depth[tree.root],
+        "tree_nodes": pool.num_nodes,
+        "proven": tree.root_proofs(),
+        "root_proven": pool.proven[tree.root],
+        "stats": tree.search_stats()
+    }
+
+
+def merge_search_stats(stats_list):
+    """Sum search_stats() of several searches and add the cache hit rates."""
+    merged = {"phase_seconds": dict.fromkeys(PHASES, 0.0)}
+    merged.update(dict.fromkeys(SEARCH_COUNTERS, 0))
+    for stats in stats_list:
+        for phase in PHASES:
+            merged["phase_seconds"][phase] += stats["phase_seconds"][phase]
+        for counter in SEARCH_COUNTERS:
+            merged[counter] += stats[counter]
+    merged["score_cache_hit_rate"] = (merged["score_cache_hits"] / float(merged["score_calls"])
+                                      if merged["score_calls"] else 0.0)
+    merged["transposition_hit_rate"] = (merged["transposition_hits"] / float(merged["transposition_lookups"])
+                                        if merged["transposition_lookups"] else 0.0)
+    return merged
+
+
+def _search_worker(game, agent_id, start_time, seconds_limit, node_limit, transposition_table_size, seed,
+                   early_stopping, stop_heuristic, stop_slot):
+    """Run one independent root-parallel search in a worker process, until done or its stop slot is set."""
+    tree = SearchTree(game, agent_id=agent_id, transposition_table_size=transposition_table_size, seed=seed)
+    time_manager = (TimeManager(start_time, seconds_limit, len(game.legal_moves()), node_limit=node_limit,
+                                heuristic=stop_heuristic)
+                    if early_stopping else None)
+    search(tree, start_time, seconds_limit, node_limit, time_manager=time_manager,
+           interrupt=lambda _: worker_pool.stop_requested(stop_slot))
+    return search_result(tree)
+
+
+def merge_root_statistics(results):
+    """Sum visits and value sums per root move over several searches of the same position."""
+    merged = OrderedDict()
+    for result in results:
+        for m, visits, value in result["moves"]:
+            stats = merged.setdefault(m, [0, 0.0])
+            stats[0] += visits
+            stats[1] += value
+    return [(m, visits, value) for m, (visits, value) in merged.items()]
+
+
+def proven_candidates(root_moves, proofs):
+    """The root moves worth choosing from, given the proven outcomes in `proofs` ({move: PROVEN_*})."""
+    wins = [entry for entry in root_moves if proofs.get(entry[0]) == PROVEN_WIN]
+    if wins:
+        return wins
+    return [entry for entry in root_moves if proofs.get(entry[0]) != PROVEN_LOSS] or root_moves
 
 
 def evaluate_next_move(game,
@@ -108,40 +562,186 @@ def evaluate_next_move(game,
                        seconds_limit=DEFAULT_SECONDS_LIMIT,
                        node_limit=DEFAULT_NODE_LIMIT,
                        verbose=True,
-                       metadata=True):
-    """Main MCTS driver function with same interface as original."""
+                       metadata=True,
+                       transposition_table_size=DEFAULT_TRANSPOSITION_TABLE_SIZE,
+                       tree=None,
+                       workers=1,
+                       seed=None,
+                       parallelism="root",
+                       early_stopping=True,
+                       stop_heuristic=False,
+                       on_progress=None,
+                       progress_interval=DEFAULT_PROGRESS_INTERVAL,
+                       book=None,
+                       endgame_solver=True):
+    """Main MCTS driver function with same interface as original.
+
+    Positions reached by different move orders share one node through a
+    transposition table of `transposition_table_size` slots (0 disables it).
+    Passing a SearchTree continues the search kept from the previous call for
+    this game instead of starting from scratch; `game` is then left untouched.
+    `node_limit` counts the iterations of this call, so visits kept in the tree
+    do not use it up.
+
+    With `workers` > 1 the search is root-parallel: `workers - 1` extra
+    searches of the same position run in warm worker processes, each seeded
+    differently, while this process searches as usual. Visit counts and value
+    sums of the root moves are merged to choose the move.
 
-    node = SimulationTreeNode(game, game.next_to_move, agent_id=agent_id)
+    With `parallelism="tree"` the `workers` processes instead grow a single
+    tree in shared memory (see ai.shared_tree). That tree is built fresh for
+    every call, so a passed SearchTree is only kept in sync, not searched.
+
+    With `early_stopping` a TimeManager scales the search to the position and
+    ends it once no other move can overtake the best one in the iterations
+    left (see ai.time_manager); each root-parallel worker decides for its own
+    tree. `stop_heuristic` also lets it stop on the heuristic stability and
+    confidence rules, while another move could still overtake. Without
+    `early_stopping` the search runs until `seconds_limit` or `node_limit`;
+    the server turns it off for `force_full_time` requests, node-budget
+    tournaments to stay reproducible and the opening book's offline searches.
+
+    `on_progress`, if given, is called every `progress_interval` seconds with
+    a snapshot of this process's tree (see ProgressReporter); returning True
+    stops the whole search, workers included, and plays the best move so far.
+
+    With an OpeningBook as `book`, positions it covers are answered from the
+    book without searching (see ai.opening_book); the tree is still synced.
+
+    With `endgame_solver`, positions with at most SOLVER_EMPTY_CELLS playable
+    cells are first solved exactly (see ai.endgame), using up to
+    SOLVER_TIME_SHARE of the time limit. A proven win or draw is played
+    without searching; a proven loss, or a position the solver could not
+    finish, is searched as usual with the time left.
+    """
+
+    # Root-parallel searches need distinct seeds to explore differently
+    if workers > 1 and seed is None:
+        seed = random.randrange(2 ** 32)
+
+    if tree is None:
+        tree = SearchTree(game, agent_id=agent_id, transposition_table_size=transposition_table_size, seed=seed)
+        reused = False
+    else:
+        reused = tree.sync(game)
+    node = tree.root
+    pool = tree.pool
+    transpositions = tree.transpositions
+    tree.reset_stats()
+    reused_gamestates = pool.visits[node] - 1 if reused else 0
+    # search() limits the root's visits, so add those the tree starts with
+    local_node_limit = node_limit + pool.visits[node]
     start_time = time.time()
+    time_manager = (TimeManager(start_time, seconds_limit, len(tree.game.legal_moves()), node_limit=local_node_limit,
+                                heuristic=stop_heuristic)
+                    if early_stopping else None)
+    reporter = (ProgressReporter(on_progress, start_time, progress_interval, reused_gamestates)
+                if on_progress is not None else None)
+
+    decided = None  # (move, root moves, stop reason, confidence) when the move needs no search
+    if book is not None:
+        book_move = book.choose(tree.game)
+        if book_move is not None:
+            m, book_moves = book_move
+            visits = next(v for bm, v, _ in book_moves if bm == m)
+            decided = (m, book_moves, "book", visits / float(sum(v for _, v, _ in book_moves)))
+    solution = None
+    if decided is None and endgame_solver and playable_cells(tree.game) <= SOLVER_EMPTY_CELLS:
+        solution = EndgameSolver().solve(tree.game, seconds_limit=seconds_limit * SOLVER_TIME_SHARE)
+        if solution.result in SOLVED_SCORES:
+            decided = (solution.best_move, [(solution.best_move, 1, SOLVED_SCORES[solution.result])], "solved", 1.0)
 
-    # Main MCTS loop
-    while (time.time() - start_time <= seconds_limit) and (node.number_of_plays < node_limit):
-        # Dynamic UCB constant based on remaining time
-        elapsed = time.time() - start_time
-        # time_ratio = elapsed / seconds_limit
-        node.expand_tree_by_one()
+    if decided is not None:
+        best_move, root_moves, stop_reason, confidence = decided
+        results = [{"moves": root_moves, "num_gamestates": 0, "depth_explored": 0, "tree_nodes": pool.num_nodes,
+                    "proven": {}, "root_proven": UNPROVEN}]
+    elif workers > 1 and parallelism == "tree":
+        from ai.shared_tree import tree_parallel_search
+        result = tree_parallel_search(tree.game, tree.agent_id, workers, start_time, seconds_limit, node_limit,
+                                      seed, time_manager=time_manager, interrupt=reporter)
+        if result is None:
+            # Another request holds the shared tree; search alone rather than wait for it
+            search(tree, start_time, seconds_limit, local_node_limit, time_manager=time_manager, interrupt=reporter)
+            result = search_result(tree)
+        results = [result]
+    elif workers > 1:
+        # Start the extra root-parallel searches before searching locally
+        executor = worker_pool.get_executor(workers - 1, agent_id=tree.agent_id)
+        with worker_pool.stop_slot() as stop_slot:
+            futures = [executor.submit(_search_worker, tree.game.copy(), tree.agent_id, start_time, seconds_limit,
+                                       node_limit, transposition_table_size, seed + w, early_stopping, stop_heuristic,
+                                       stop_slot)
+                       for w in range(1, workers)]
+            search(tree, start_time, seconds_limit, local_node_limit, time_manager=time_manager, interrupt=reporter)
+            # Workers otherwise keep to their own limits, so seeded node-limited searches stay reproducible
+            if (reporter is not None and reporter.interrupted) or pool.proven[node] != UNPROVEN:
+                worker_pool.request_stop(stop_slot)
+            results = [search_result(tree)] + [f.result() for f in futures]
+    else:
+        # Main MCTS loop
+        search(tree, start_time, seconds_limit, local_node_limit, time_manager=time_manager, interrupt=reporter)
+        results = [search_result(tree)]
+
+    if decided is not None:
+        best_score = next(value / float(visits) for m, visits, value in root_moves if m == best_move)
+        new_gamestates = 0
+    else:
+        root_moves = merge_root_statistics(results)
+        proofs = {}
+        for r in results:
+            proofs.update(r["proven"])
+        # Best move by average score among those not proven worse; on ties the latest expanded move wins
+        best_move, best_score = best_root_move(proven_candidates(root_moves, proofs))
+        if best_move is None and not tree.game.board.winner:
+            # No iteration ran (the time was already up), so there are no root statistics to choose from
+            best_move = tree.game.greedy_next_move() or next(iter(tree.game.legal_moves()), None)
+        # Iterations run by this call, not counting visits kept from the previous search
+        new_gamestates = sum(r["num_gamestates"] for r in results) - reused_gamestates
+        confidence = time_manager.confidence if time_manager is not None else None
+        if max(r["root_proven"] for r in results) != UNPROVEN:
+            stop_reason = "proven"
+            confidence = 1.0
+        elif reporter is not None and reporter.interrupted:
+            stop_reason = "interrupted"
+        else:
+            stop_reason = time_manager.stop_reason if time_manager is not None else None
 
-    best_move = node.get_best_action_by_average_score()
+    thinking_time = time.time() - start_time
+    num_gamestates = sum(r["num_gamestates"] for r in results)
+    search_stats = [r["stats"] for r in results if "stats" in r]
 
     if metadata:
         move_metadata = {
-            "num_gamestates": node.number_of_plays,
-            "depth_explored": node.depth_seen,
-            "moves": sorted([(m, node.get_score_of_move(m)) for m in node.children],
+            "num_gamestates": num_gamestates,
+            "depth_explored": max(r["depth_explored"] for r in results),
+            "moves": sorted([(m, value / float(visits), visits) for m, visits, value in root_moves],
                             key=lambda x: x[1])[::-1],
-            "thinking_time": time.time() - start_time,
-            "early_stop": False  # Simplified to always use full time
+            "thinking_time": thinking_time,
+            "nodes_per_second": new_gamestates / thinking_time if thinking_time > 0 else 0.0,
+            "early_stop": stop_reason is not None,
+            "stop_reason": stop_reason,
+            "confidence": confidence,
+            "transposition_hit_rate": transpositions.hit_rate if transpositions is not None else 0.0,
+            "reused_gamestates": reused_gamestates,
+            "tree_nodes": sum(r["tree_nodes"] for r in results),
+            "bytes_per_node": NodePool.bytes_per_node(),
+            "workers": workers,
+            "parallelism": parallelism if workers > 1 else "none",
+            "solver": solution.to_dict() if solution is not None else None,
+            "proven": PROVEN_NAMES.get(max(r["root_proven"] for r in results)),
+            # Book and solver moves run no search, and the shared tree keeps no statistics
+            "search_stats": merge_search_stats(search_stats) if search_stats else None
         }
 
         if verbose:
             print("number of gamestates evaluated: {}".format(move_metadata["num_gamestates"]))
             print("depth of game tree explored: {}".format(move_metadata["depth_explored"]))
+            print("nodes per second: {:.0f}".format(move_metadata["nodes_per_second"]))
             print("best move for {}: {}".format(game.next_to_move, best_move))
-            print("score of best move: {}".format(
-                node.children[best_move].total_score / float(node.children[best_move].number_of_plays)))
+            print("score of best move: {}".format(best_score))
             print("top moves:\n")
-            for m, s in move_metadata["moves"]:
-                print("\tmove: {}\tnum_plays: {}\tscore: {}".format(m, node.children[m].number_of_plays, s))
+            for m, s, visits in move_metadata["moves"]:
+                print("\tmove: {}\tnum_plays: {}\tscore: {}".format(m, visits, s))
 
         return [best_move[0], best_move[1], move_metadata]
     return best_move
\ No newline at end of file
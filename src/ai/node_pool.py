@@ -0,0 +1,138 @@
+"""
+Struct-of-arrays storage for MCTS trees.
+
+Nodes and edges are integer handles into flat `array` buffers instead of
+Python objects, so a node costs a few dozen bytes and creates no garbage for
+the collector to track. Edges are stored separately from nodes because the
+transposition table lets one node hang below several parents; each parent
+keeps its own chain of edges (first edge, next sibling), newest first.
+
+Freed handles go on a freelist and are reused before the buffers grow.
+
+A node whose game outcome is known exactly (a finished game, or settled by
+minimax over its children) carries that outcome in `proven`, from the root
+player's perspective. The PROVEN_* values are ordered from worst to best for
+that player.
+"""
+from array import array
+
+NO_HANDLE = -1
+UNPROVEN, PROVEN_LOSS, PROVEN_DRAW, PROVEN_WIN = 0, 1, 2, 3
+
+# Moves are stored as one byte: board * 9 + cell
+MOVES = tuple((b, c) for b in range(9) for c in range(9))
+
+
+def move_byte(move):
+    return move[0] * 9 + move[1]
+
+
+class NodePool:
+    NODE_TYPECODES = {"visits": "i", "value": "d", "depth": "H", "unseen": "B", "first_edge": "i", "key": "Q",
+                      "proven": "b"}
+    EDGE_TYPECODES = {"edge_move": "B", "edge_child": "i", "edge_next": "i"}
+
+    def __init__(self):
+        self.visits = array("i")      # number of plays through the node
+        self.value = array("d")       # sum of rollout scores, from the root player's perspective
+        self.depth = array("H")       # deepest path length seen below the node
+        self.unseen = array("B")      # legal moves not yet expanded; the next one is legal_moves()[unseen - 1]
+        self.first_edge = array("i")  # newest edge to a child, or NO_HANDLE
+        self.key = array("Q")         # Game.position_hash() of the node's position
+        self.proven = array("b")      # UNPROVEN, or the proven outcome for the root player
+        self.edge_move = array("B")
+        self.edge_child = array("i")
+        self.edge_next = array("i")
+        self.free_nodes = array("i")
+        self.free_edges = array("i")
+
+    def clear(self):
+        # Buffers are emptied in place; other objects (the transposition table) hold references to them
+        for name in list(self.NODE_TYPECODES) + list(self.EDGE_TYPECODES) + ["free_nodes", "free_edges"]:
+            del getattr(self, name)[:]
+
+    def new_node(self, unseen, key):
+        if self.free_nodes:
+            node = self.free_nodes.pop()
+            self.visits[node] = 1
+            self.value[node] = 0.0
+            self.depth[node] = 1
+            self.unseen[node] = unseen
+            self.first_edge[node] = NO_HANDLE
+            self.key[node] = key
+            self.proven[node] = UNPROVEN
+            return node
+        self.visits.append(1)
+        self.value.append(0.0)
+        self.depth.append(1)
+        self.unseen.append(unseen)
+        self.first_edge.append(NO_HANDLE)
+        self.key.append(key)
+        self.proven.append(UNPROVEN)
+        return len(self.visits) - 1
+
+    def add_child(self, parent, move, child):
+        """Link `child` below `parent` through the move byte `move`."""
+        if self.free_edges:
+            edge = self.free_edges.pop()
+            self.edge_move[edge] = move
+            self.edge_child[edge] = child
+            self.edge_next[edge] = self.first_edge[parent]
+        else:
+            edge = len(self.edge_move)
+            self.edge_move.append(move)
+            self.edge_child.append(child)
+            self.edge_next.append(self.first_edge[parent])
+        self.first_edge[parent] = edge
+
+    def children(self, node):
+        """Yield (move byte, child) pairs, newest first."""
+        edge = self.first_edge[node]
+        while edge != NO_HANDLE:
+            yield self.edge_move[edge], self.edge_child[edge]
+            edge = self.edge_next[edge]
+
+    def child(self, node, move):
+        """Child reached through the move byte `move`, or NO_HANDLE."""
+        edge = self.first_edge[node]
+        while edge != NO_HANDLE:
+            if self.edge_move[edge] == move:
+                return self.edge_child[edge]
+            edge = self.edge_next[edge]
+        return NO_HANDLE
+
+    def retain(self, root):
+        """Free every node and edge that is not reachable from `root`. Returns the reachable nodes."""
+        reachable = bytearray(len(self.visits))
+        kept_edges = bytearray(len(self.edge_move))
+        reachable[root] = 1
+        stack = [root]
+        nodes = []
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            edge = self.first_edge[node]
+            while edge != NO_HANDLE:
+                kept_edges[edge] = 1
+                child = self.edge_child[edge]
+                if not reachable[child]:
+                    reachable[child] = 1
+                    stack.append(child)
+                edge = self.edge_next[edge]
+        self.free_nodes = array("i", (n for n in range(len(reachable)) if not reachable[n]))
+        self.free_edges = array("i", (e for e in range(len(kept_edges)) if not kept_edges[e]))
+        return nodes
+
+    @property
+    def num_nodes(self):
+        return len(self.visits) - len(self.free_nodes)
+
+    @classmethod
+    def bytes_per_node(cls):
+        """Storage for one node plus the edge pointing to it."""
+        return sum(array(t).itemsize for t in list(cls.NODE_TYPECODES.values()) + list(cls.EDGE_TYPECODES.values()))
+
+    def memory_bytes(self):
+        """Bytes currently allocated to node and edge buffers, including freed slots."""
+        return sum(len(getattr(self, name)) * getattr(self, name).itemsize
+                   for name in list(self.NODE_TYPECODES) + list(self.EDGE_TYPECODES))
@@ -0,0 +1,209 @@
+"""
+Opening book built from self-play, read through mmap.
+
+The first plies of every game reach the same few positions, so searching
+them from scratch wastes most of the time limit. `build_book` replays the
+games saved in `data/self_play_games` and adds up, for every position within
+`max_ply` plies of the start, the root statistics that the search recorded
+in the move metadata: visits and value sum per move, from the mover's
+perspective. Optionally, the positions within `search_plies` plies are also
+searched offline for `search_seconds` each and the results are added too.
+
+The book file is a fixed-size hash table followed by the move records:
+
+    header   magic, version, max_ply, slot count, position count
+    slots    (position hash, first move record, move count) per slot,
+             linear probing from hash % slots, move count 0 = empty
+    moves    (move byte, visits, value sum) per move
+
+OpeningBook maps the file and probes it with struct.unpack_from, so a lookup
+takes microseconds and nothing is loaded up front. A position is only played
+from the book once its moves add up to `min_visits` visits; the most visited
+move is played.
+"""
+import argparse
+import mmap
+import struct
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ai.node_pool import MOVES, move_byte
+from core.game import Game
+from utils.game_storage import GameStorage
+from config import BOOK_MAX_PLY, BOOK_MIN_VISITS, OPENING_BOOK_PATH
+
+MAGIC = b"UTTB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")  # magic, version, max_ply, slots, positions
+SLOT = struct.Struct("<QIHxx")  # position hash, offset of the first move record, moves
+MOVE = struct.Struct("<BIf")  # move byte, visits, value sum
+
+
+class OpeningBook:
+    def __init__(self, path, min_visits=BOOK_MIN_VISITS):
+        self.path = path
+        self.min_visits = min_visits
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is not an opening book")
+        magic, version, self.max_ply, self.num_slots, self.num_positions = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book (version {VERSION})")
+
+    def lookup(self, key):
+        """(move, visits, value sum) for each book move of the position with hash `key`, or None."""
+        data = self.data
+        mask = self.num_slots - 1
+        slot = key & mask
+        while True:
+            slot_key, offset, count = SLOT.unpack_from(data, HEADER.size + slot * SLOT.size)
+            if count == 0:
+                return None
+            if slot_key == key:
+                moves = []
+                for i in range(count):
+                    m, visits, value = MOVE.unpack_from(data, offset + i * MOVE.size)
+                    moves.append((MOVES[m], visits, value))
+                return moves
+            slot = (slot + 1) & mask
+
+    def choose(self, game):
+        """The book move for `game` and the book's statistics of its position, or None when out of book."""
+        # Positions built with make_game carry only the last move, so count the pieces
+        if sum(bin(mini.x | mini.o).count("1") for mini in game.board.boards) >= self.max_ply:
+            return None
+        moves = self.lookup(game.position_hash())
+        if moves is None or sum(visits for _, visits, _ in moves) < self.min_visits:
+            return None
+        legal_moves = game.legal_moves()
+        best_move = None
+        best_visits = 0
+        for m, visits, _ in moves:
+            # A hash collision could name a move that is not legal here
+            if visits > best_visits and m in legal_moves:
+                best_move = m
+                best_visits = visits
+        if best_move is None:
+            return None
+        return best_move, moves
+
+    def close(self):
+        self.data.close()
+
+
+def add_root_moves(positions, key, root_moves):
+    """Add (move, average score, visits) search results for the position `key`.
+
+    Games recorded before visit counts were kept have (move, average score)
+    entries; each counts as one visit.
+    """
+    stats = positions.setdefault(key, OrderedDict())
+    for entry in root_moves:
+        m, score = entry[0], entry[1]
+        visits = entry[2] if len(entry) > 2 else 1
+        move_stats = stats.setdefault(tuple(m), [0, 0.0])
+        move_stats[0] += visits
+        move_stats[1] += score * visits
+
+
+def recorded_moves(game_data):
+    """(board, cell, metadata) for each move of a saved game.
+
+    Self-play saves its whole move log as the metadata of a single entry;
+    games saved by the server have one entry per move.
+    """
+    moves = game_data["moves"]
+    if len(moves) == 1 and isinstance(moves[0].get("metadata"), list):
+        return [(m["move"]["board"], m["move"]["cell"], m["metadata"]) for m in moves[0]["metadata"]]
+    return [(m["board"], m["cell"], m.get("metadata")) for m in moves]
+
+
+def build_book(games_dir, max_ply=BOOK_MAX_PLY, agent_id="default", search_plies=0, search_seconds=0):
+    """
+    Aggregate the self-play games in `games_dir` into {position hash: {move: [visits, value sum]}}.
+
+    With `search_seconds` > 0, every position within `search_plies` plies
+    that the games reach (and the start position) is also searched for that
+    long with `agent_id`, and the results are added.
+    """
+    positions = {}
+    to_search = OrderedDict()  # position hash -> game, for the offline searches
+    start = Game()
+    to_search[start.position_hash()] = start.copy()
+    num_games = 0
+
+    storage = GameStorage(data_dir=games_dir)
+    for path in sorted(Path(games_dir).glob("*.json")):
+        game_data = storage.load_game(path.stem)
+        num_games += 1
+        game = Game()
+        for ply, (board, cell, metadata) in enumerate(recorded_moves(game_data)[:max_ply]):
+            key = game.position_hash()
+            if ply < search_plies and key not in to_search:
+                to_search[key] = game.copy()
+            if metadata and metadata.get("moves"):
+                add_root_moves(positions, key, metadata["moves"])
+            if not game.make_move(board, cell, game.next_to_move):
+                print(f"Illegal move {ply + 1} in {path.name}; skipping the rest of the game")
+                break
+
+    if search_seconds > 0:
+        from ai.mcts import evaluate_next_move
+        for i, (key, game) in enumerate(to_search.items()):
+            print(f"Searching book position {i + 1}/{len(to_search)}")
+            result = evaluate_next_move(game, agent_id=agent_id, seconds_limit=search_seconds, verbose=False,
+                                        early_stopping=False)
+            add_root_moves(positions, key, result[2]["moves"])
+
+    print(f"Read {num_games} games into {len(positions)} book positions")
+    return positions
+
+
+def write_book(positions, path, max_ply=BOOK_MAX_PLY):
+    """Write `positions` as returned by build_book to the book file at `path`."""
+    num_slots = 1
+    while num_slots < 2 * len(positions):  # at most half full, so probes stay short
+        num_slots *= 2
+
+    slots = [None] * num_slots
+    records = bytearray()
+    moves_start = HEADER.size + num_slots * SLOT.size
+    for key, stats in positions.items():
+        # Most visited first, so readers see the book's choice first
+        moves = sorted(stats.items(), key=lambda item: item[1][0], reverse=True)
+        offset = moves_start + len(records)
+        for m, (visits, value) in moves:
+            records += MOVE.pack(move_byte(m), min(visits, 2 ** 32 - 1), value)
+        slot = key & (num_slots - 1)
+        while slots[slot] is not None:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = (key, offset, len(moves))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_ply, num_slots, len(positions)))
+        empty = SLOT.pack(0, 0, 0)
+        f.write(b"".join(SLOT.pack(*s) if s is not None else empty for s in slots))
+        f.write(records)
+    temp_path.replace(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the opening book from self-play games")
+    parser.add_argument("--games", type=str, default="data/self_play_games", help="Directory of self-play games")
+    parser.add_argument("--out", type=str, default=OPENING_BOOK_PATH, help="Book file to write")
+    parser.add_argument("--max_ply", type=int, default=BOOK_MAX_PLY, help="Deepest ply kept in the book")
+    parser.add_argument("--agent", type=str, default="default", help="Agent ID for the offline searches")
+    parser.add_argument("--search_plies", type=int, default=0, help="Also search positions up to this ply")
+    parser.add_argument("--search_seconds", type=int, default=0, help="Seconds per offline search")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    book = build_book(args.games, max_ply=args.max_ply, agent_id=args.agent, search_plies=args.search_plies,
+                      search_seconds=args.search_seconds)
+    write_book(book, args.out, max_ply=args.max_ply)
+    print(f"Wrote {args.out} in {time.time() - start_time:.1f}s")
@@ -0,0 +1,96 @@
+"""
+Background search on the opponent's turn.
+
+After the server plays a move, the game's SearchTree is advanced past that
+move and handed to a Ponderer, which keeps growing it while the human
+thinks. When the human's move arrives, the request takes the tree back;
+SearchTree.sync re-roots it on the actual reply and the search continues with
+everything pondered below that reply.
+
+A single background thread does all pondering, running a few iterations
+for each pondered game in turn, and sleeps between slices so that it is
+busy at most `cpu_share` of the time. The thread pauses while any
+foreground search is running. At most `max_games` games are pondered at
+once, and the least recently played game stops first. Each game is pondered
+for at most `seconds_limit` seconds, until its root reaches `node_limit`
+visits or until its root is proven. Trees that stop being pondered go back
+to the SearchTreeCache they came from.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from ai.node_pool import UNPROVEN
+
+ITERATIONS_PER_SLICE = 32  # iterations run for one game before moving to the next
+
+
+class Ponderer:
+    def __init__(self, cache, max_games, seconds_limit, node_limit, cpu_share=1.0):
+        self.cache = cache
+        self.max_games = max_games
+        self.cpu_share = cpu_share
+        self.seconds_limit = seconds_limit
+        self.node_limit = node_limit
+        self.games = OrderedDict()  # game_id -> (tree, deadline), next to search first
+        self.condition = threading.Condition()
+        self.foreground_searches = 0
+        self.thread = None
+
+    def start(self, game_id, tree):
+        """Ponder `tree` (already advanced to the opponent's turn) for `game_id`."""
+        if self.max_games == 0 or not tree.game.legal_moves():
+            self.cache.put(game_id, tree)
+            return
+        with self.condition:
+            self.games[game_id] = (tree, time.time() + self.seconds_limit)
+            while len(self.games) > self.max_games:
+                # Every game gets the same time limit, so the earliest deadline is the least recently played
+                self._finish(min(self.games, key=lambda g: self.games[g][1]))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="ponder", daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def stop(self, game_id):
+        """Stop pondering `game_id` and return its tree, or None if it was not being pondered."""
+        with self.condition:
+            tree, _ = self.games.pop(game_id, (None, None))
+            return tree
+
+    @contextmanager
+    def paused(self):
+        """Suspend pondering while a foreground search runs."""
+        with self.condition:
+            self.foreground_searches += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.foreground_searches -= 1
+                self.condition.notify_all()
+
+    def _finish(self, game_id):
+        tree, _ = self.games.pop(game_id)
+        self.cache.put(game_id, tree)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.games or self.foreground_searches:
+                    self.condition.wait()
+                slice_start = time.time()
+                game_id, (tree, deadline) = next(iter(self.games.items()))
+                self.games.move_to_end(game_id)
+
+                # The slice runs under the lock, so stop() never takes a tree mid-iteration
+                pool = tree.pool
+                for _ in range(ITERATIONS_PER_SLICE):
+                    if (pool.visits[tree.root] >= self.node_limit or pool.proven[tree.root] != UNPROVEN
+                            or time.time() > deadline):
+                        self._finish(game_id)
+                        break
+                    tree.expand_tree_by_one(tree.root)
+            # Stay within the CPU share, and let request threads in between slices
+            time.sleep((time.time() - slice_start) * (1 / self.cpu_share - 1))
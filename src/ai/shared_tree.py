@@ -0,0 +1,313 @@
+"""
+Tree-parallel MCTS: several processes grow one tree held in shared memory.
+
+The tree lives in a SharedTreeArena, fixed-capacity node and edge buffers in
+`multiprocessing.shared_memory` laid out like NodePool. Updates go through
+striped locks (node handle modulo the number of locks), and allocation goes
+through a single lock. Each process walks the tree with its own Game, and a
+virtual loss is added to every node it descends through until its result is
+backed up. Other processes see those nodes as visited with a score of 0, so
+they spread out over different lines instead of repeating the same descent.
+
+The arena and its worker processes are created once and reused. Only one
+tree-parallel search runs at a time: a search requested while another one
+holds the arena is not started, and the caller searches on its own instead.
+The shared tree is not kept between moves. The transposition table is not
+used in this mode.
+"""
+import atexit
+import math
+import multiprocessing
+import threading
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from ai import worker_pool
+from ai.mcts import SearchTree, MAX_PATH_LENGTH
+from ai.node_pool import NodePool, NO_HANDLE, MOVES, move_byte, UNPROVEN
+
+DEFAULT_SHARED_TREE_CAPACITY = 2 ** 20
+NUM_LOCK_STRIPES = 64
+
+
+class SharedTreeArena(NodePool):
+    NODE_TYPECODES = {"visits": "i", "value": "d", "depth": "H", "unseen": "B", "first_edge": "i", "virtual": "i"}
+    HEADER_TYPECODE = "q"  # [nodes allocated, edges allocated, stop flag]
+
+    def __init__(self, capacity, locks, alloc_lock, names=None):
+        """Create the shared buffers, or attach to existing ones when `names` is given."""
+        self.capacity = capacity
+        self.locks = locks
+        self.alloc_lock = alloc_lock
+        self.owner = names is None
+        self.segments = {}
+        self.names = {}
+        fields = dict(self.NODE_TYPECODES, **self.EDGE_TYPECODES, header=self.HEADER_TYPECODE)
+        for field, typecode in fields.items():
+            length = 3 if field == "header" else capacity
+            if self.owner:
+                size = length * memoryview(bytes(8)).cast(typecode).itemsize
+                segment = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                segment = shared_memory.SharedMemory(name=names[field])
+            self.segments[field] = segment
+            self.names[field] = segment.name
+            setattr(self, field, segment.buf.cast(typecode))
+
+    def lock_for(self, node):
+        return self.locks[node % len(self.locks)]
+
+    def clear(self):
+        self.header[0] = 0
+        self.header[1] = 0
+        self.header[2] = 0
+
+    @property
+    def stopped(self):
+        return self.header[2] != 0
+
+    def stop(self):
+        """Tell every process searching the arena to finish its current iteration and return."""
+        self.header[2] = 1
+
+    @property
+    def num_nodes(self):
+        return self.header[0]
+
+    def new_node(self, unseen, key=0):
+        with self.alloc_lock:
+            node = self.header[0]
+            if node >= self.capacity:
+                return NO_HANDLE
+            self.header[0] = node + 1
+        self.visits[node] = 1
+        self.value[node] = 0.0
+        self.depth[node] = 1
+        self.unseen[node] = unseen
+        self.first_edge[node] = NO_HANDLE
+        self.virtual[node] = 0
+        return node
+
+    def add_child(self, parent, move, child):
+        with self.alloc_lock:
+            edge = self.header[1]
+            self.header[1] = edge + 1
+        self.edge_move[edge] = move
+        self.edge_child[edge] = child
+        # The edge is complete before it is published as the parent's first edge
+        with self.lock_for(parent):
+            self.edge_next[edge] = self.first_edge[parent]
+            self.first_edge[parent] = edge
+
+    def close(self):
+        for field, segment in self.segments.items():
+            getattr(self, field).release()
+            segment.close()
+            if self.owner:
+                segment.unlink()
+        self.segments = {}
+
+
+class SharedSearchTree(SearchTree):
+    """One process's view of the shared tree; the root is always handle 0."""
+
+    def __init__(self, game, arena, agent_id='default', seed=None):
+        self.load_config(agent_id, seed)
+        # Every process must map a node's unseen count to the same move, or moves get expanded twice
+        self.order_offset = 0
+        self.pool = arena
+        self.path = array("i", [NO_HANDLE]) * MAX_PATH_LENGTH
+        self.transpositions = None
+        self.game = game
+        self.player = game.next_to_move
+        self.root = 0
+
+    def get_best_action_by_ucb1(self, node, C):
+        arena = self.pool
+        action = NO_HANDLE
+        best_score = -float("inf")
+        log_plays = math.log(arena.visits[node] + arena.virtual[node])
+        for m, c in arena.children(node):
+            # Each virtual loss counts as a visit that scored 0
+            plays = float(arena.visits[c] + arena.virtual[c])
+            ucb = arena.value[c] / plays + 2 * C * math.sqrt(2 * log_plays / plays)
+            if ucb > best_score:
+                best_score = ucb
+                action = m
+        return action
+
+    def expand_one_child(self, node):
+        """Expand one unseen child of `node` and return its rollout score (None if nothing was expanded)."""
+        arena = self.pool
+        game = self.game
+        with arena.lock_for(node):
+            if arena.unseen[node] == 0:
+                return None
+            arena.unseen[node] -= 1
+            index = arena.unseen[node]
+
+        legal_moves = game.legal_moves()
+        m = legal_moves[(index + self.order_offset) % len(legal_moves)]
+        game.make_move(m[0], m[1], game.next_to_move)
+        child = arena.new_node(len(game.legal_moves()))
+        if child == NO_HANDLE:
+            game.undo_last_move()
+            return None
+
+        # Run quick simulation
+        moves_made = 1
+        depth = 0
+        while depth < self.rollout_depth and not game.board.winner and game.legal_moves():
+            if self.rng is not None and self.rng.random() < self.rollout_epsilon:
+                legal_moves = game.legal_moves()
+                greedy_move = legal_moves[self.rng.randrange(len(legal_moves))]
+            else:
+                greedy_move = game.greedy_next_move()
+            if not greedy_move:
+                break
+            game.make_move(greedy_move[0], greedy_move[1], game.next_to_move)
+            moves_made += 1
+            depth += 1
+
+        score = game.board.score(self.player)
+        arena.value[child] = score
+        arena.add_child(node, move_byte(m), child)
+
+        for _ in range(moves_made):
+            game.undo_last_move()
+        return score
+
+    def expand_tree_by_one(self, node):
+        arena = self.pool
+        game = self.game
+        path = self.path
+
+        # Selection, adding a virtual loss to every node we pass through
+        length = 0
+        while arena.unseen[node] == 0 and arena.first_edge[node] != NO_HANDLE:
+            m = self.get_best_action_by_ucb1(node, self.ucb_constant)
+            with arena.lock_for(node):
+                arena.virtual[node] += 1
+            path[length] = node
+            length += 1
+            game.make_move(*MOVES[m], game.next_to_move)
+            node = arena.child(node, m)
+        with arena.lock_for(node):
+            arena.virtual[node] += 1
+        path[length] = node
+        length += 1
+
+        if arena.unseen[node] != 0:
+            score = self.expand_one_child(node)
+        elif arena.first_edge[node] == NO_HANDLE and (game.board.winner or not game.legal_moves()):
+            score = game.board.score(self.player)
+        else:
+            # Another process expanded the last child while we were selecting, or is still rolling
+            # out every child of a node that has none published yet; only the virtual loss is undone
+            score = None
+
+        # Backpropagate and remove the virtual losses
+        for i in range(length):
+            n = path[i]
+            with arena.lock_for(n):
+                arena.virtual[n] -= 1
+                if score is not None:
+                    arena.visits[n] += 1
+                    arena.value[n] += score
+                    if length - i > arena.depth[n]:
+                        arena.depth[n] = length - i
+        for _ in range(length - 1):
+            game.undo_last_move()
+
+
+def shared_search(tree, start_time, seconds_limit, node_limit, time_manager=None, interrupt=None):
+    arena = tree.pool
+    while (time.time() - start_time <= seconds_limit and arena.visits[tree.root] < node_limit
+           and arena.num_nodes < arena.capacity and not arena.stopped):
+        tree.expand_tree_by_one(tree.root)
+        if time_manager is not None and time_manager.should_stop(tree):
+            break
+        if interrupt is not None and interrupt(tree):
+            break
+
+
+_arena = None  # the arena owned by this process, or attached to in a worker
+_search_lock = threading.Lock()
+
+
+@atexit.register
+def _close_arena():
+    # Views into the segments must be released before the interpreter tears them down
+    if _arena is not None and _arena.owner:
+        worker_pool.shutdown(kind="tree")
+        _arena.close()
+
+
+def _attach_arena(capacity, names, locks, alloc_lock):
+    global _arena
+    _arena = SharedTreeArena(capacity, locks, alloc_lock, names=names)
+
+
+def _tree_worker(game, agent_id, start_time, seconds_limit, node_limit, seed):
+    tree = SharedSearchTree(game, _arena, agent_id=agent_id, seed=seed)
+    shared_search(tree, start_time, seconds_limit, node_limit)
+    return True
+
+
+def _get_arena(workers, capacity, agent_id):
+    """Return the arena and the worker pool attached to it, recreating both if the shape changed."""
+    global _arena
+    if _arena is None or _arena.capacity != capacity:
+        worker_pool.shutdown(kind="tree")
+        if _arena is not None:
+            _arena.close()
+        locks = [multiprocessing.Lock() for _ in range(NUM_LOCK_STRIPES)]
+        _arena = SharedTreeArena(capacity, locks, multiprocessing.Lock())
+    executor = worker_pool.get_executor(workers - 1, agent_id=agent_id, kind="tree", initializer=_attach_arena,
+                                        initargs=(capacity, _arena.names, _arena.locks, _arena.alloc_lock))
+    return _arena, executor
+
+
+def warm_up(workers, agent_id='default', capacity=DEFAULT_SHARED_TREE_CAPACITY):
+    """Create the arena and start its worker processes now, so the first search does not pay for it."""
+    with _search_lock:
+        arena = _get_arena(workers, capacity, agent_id)[0]
+        worker_pool.warm_up(workers - 1, agent_id=agent_id, kind="tree", initializer=_attach_arena,
+                            initargs=(capacity, arena.names, arena.locks, arena.alloc_lock))
+
+
+def tree_parallel_search(game, agent_id, workers, start_time, seconds_limit, node_limit, seed,
+                         capacity=DEFAULT_SHARED_TREE_CAPACITY, time_manager=None, interrupt=None):
+    """Search `game` with `workers` processes (this one included) growing one shared tree.
+
+    `time_manager` and `interrupt` run in this process; when either stops the
+    search, the workers are stopped too. Returns the root statistics in the same shape
+    as a root-parallel worker's result, or None without searching when another
+    tree-parallel search holds the arena, as waiting for it would use up this search's time.
+    """
+    if not _search_lock.acquire(blocking=False):
+        return None
+    try:
+        arena, executor = _get_arena(workers, capacity, agent_id)
+        arena.clear()
+        arena.new_node(len(game.legal_moves()))
+        futures = [executor.submit(_tree_worker, game.copy(), agent_id, start_time, seconds_limit, node_limit,
+                                   seed + w)
+                   for w in range(1, workers)]
+        tree = SharedSearchTree(game.copy(), arena, agent_id=agent_id, seed=seed)
+        shared_search(tree, start_time, seconds_limit, node_limit, time_manager=time_manager, interrupt=interrupt)
+        arena.stop()
+        for future in futures:
+            future.result()
+        return {
+            "moves": tree.root_statistics(),
+            "num_gamestates": arena.visits[tree.root],
+            "depth_explored": arena.depth[tree.root],
+            "tree_nodes": arena.num_nodes,
+            # Proofs are not tracked in the shared tree
+            "proven": {},
+            "root_proven": UNPROVEN
+        }
+    finally:
+        _search_lock.release()
@@ -0,0 +1,170 @@
+"""
+Time management for evaluate_next_move.
+
+Positions differ widely in how much search they need: a forced move needs
+none, and a position where one move dominates settles within a fraction of
+the time limit. TimeManager gives each search an effort budget based on the
+number of legal moves and the time available, and stops it early once the
+best root move can no longer change.
+
+The budget is `legal moves * rate`. The rate comes from COMP_DIST_FEW_MOVES,
+COMP_DIST_MEDIUM_MOVES or COMP_DIST_MANY_MOVES, depending on how the number
+of legal moves compares with MEDIUM_POSITION_THRESHOLD and
+COMPLEX_POSITION_THRESHOLD. Within that list, the entry is picked by the
+time limit: up to GREEDY_TIME_THRESHOLD, up to MEDIUM_TIME_THRESHOLD, or
+more. The budget never exceeds the time limit.
+
+Every CHECK_INTERVAL seconds the root is inspected. The best move is the one
+evaluate_next_move would play. The search stops ("clinched") once every root
+move has been tried and no other move can overtake the best one, even if
+every remaining iteration scored MAX_SCORE for it and MIN_SCORE for the best
+move. The remaining iterations are those left of the node limit, or the
+iterations the rate so far, times RATE_MARGIN, fits into the time left of the
+budget, whichever is fewer.
+
+With `heuristic`, the search may also stop while another move could still
+overtake the best one. The best move is "stable" for as many consecutive
+checks as it has not changed. Confidence is the mean of the best move's
+share of root visits and its average-score lead over the runner-up, scaled
+by SCORE_DIFF_NORMALIZER. Once MIN_TIME_RATIO of the budget has passed, the
+search stops when:
+  - confidence >= CONFIDENCE_HIGH and stable for STABLE_CHECKS_HIGH checks,
+  - confidence >= CONFIDENCE_MODERATE and stable for STABLE_CHECKS_MODERATE checks,
+  - or the best move is stable for STABLE_CHECKS_LOW checks.
+"""
+import time
+
+from config import (GREEDY_TIME_THRESHOLD, MEDIUM_TIME_THRESHOLD, MIN_TIME_RATIO, CHECK_INTERVAL,
+                    COMPLEX_POSITION_THRESHOLD, MEDIUM_POSITION_THRESHOLD, CONFIDENCE_HIGH, CONFIDENCE_MODERATE,
+                    STABLE_CHECKS_HIGH, STABLE_CHECKS_MODERATE, STABLE_CHECKS_LOW, SCORE_DIFF_NORMALIZER,
+                    COMP_DIST_FEW_MOVES, COMP_DIST_MEDIUM_MOVES, COMP_DIST_MANY_MOVES)
+
+MIN_SCORE = 0.0  # Board.score of a lost position; every score lies in [MIN_SCORE, MAX_SCORE]
+MAX_SCORE = 1.0  # Board.score of a won position
+RATE_MARGIN = 2.0  # remaining iterations are counted at this multiple of the rate so far
+
+
+def best_root_move(root_moves):
+    """Pick the move with the best average score from (move, visits, value sum) tuples.
+
+    Moves are in expansion order, so on ties the latest expanded move wins.
+    Returns (move, average score), or (None, -inf) when there are no moves.
+    """
+    best_move = None
+    best_score = -float("inf")
+    for m, visits, value in root_moves:
+        if value / float(visits) >= best_score:
+            best_score = value / float(visits)
+            best_move = m
+    return best_move, best_score
+
+
+def effort_seconds(seconds_limit, num_moves):
+    """Seconds worth spending on a position with `num_moves` legal moves."""
+    if num_moves >= COMPLEX_POSITION_THRESHOLD:
+        distribution = COMP_DIST_MANY_MOVES
+    elif num_moves >= MEDIUM_POSITION_THRESHOLD:
+        distribution = COMP_DIST_MEDIUM_MOVES
+    else:
+        distribution = COMP_DIST_FEW_MOVES
+
+    if seconds_limit <= GREEDY_TIME_THRESHOLD:
+        rate = distribution[0]
+    elif seconds_limit <= MEDIUM_TIME_THRESHOLD:
+        rate = distribution[1]
+    else:
+        rate = distribution[2]
+    return min(seconds_limit, num_moves * rate)
+
+
+class TimeManager:
+    """Decides when a search may stop before its time limit."""
+
+    def __init__(self, start_time, seconds_limit, num_moves, node_limit=float("inf"), heuristic=False):
+        self.forced = num_moves == 1
+        self.num_moves = num_moves
+        self.node_limit = node_limit
+        self.heuristic = heuristic
+        self.effort = effort_seconds(seconds_limit, num_moves)
+        # When the budget is the whole time limit, the search loop's own limit applies
+        self.target = start_time + self.effort if self.effort < seconds_limit else float("inf")
+        self.deadline = start_time + self.effort
+        self.earliest = start_time + MIN_TIME_RATIO * self.effort
+        self.start = None  # (time, root visits) after the first iteration, to measure the rate
+        self.next_check = start_time + CHECK_INTERVAL
+        self.best_move = None
+        self.stable_checks = 0
+        self.confidence = 0.0
+        self.stop_reason = None
+
+    def update(self, root_moves):
+        """Record the best root move and the confidence in it."""
+        best_move, best_score = best_root_move(root_moves)
+        if best_move is not None and best_move == self.best_move:
+            self.stable_checks += 1
+        else:
+            self.stable_checks = 0
+        self.best_move = best_move
+
+        total_visits = 0
+        best_visits = 0
+        runner_up_score = None
+        for m, visits, value in root_moves:
+            total_visits += visits
+            if m == best_move:
+                best_visits = visits
+            elif runner_up_score is None or value / float(visits) > runner_up_score:
+                runner_up_score = value / float(visits)
+        if total_visits == 0:
+            self.confidence = 0.0
+            return
+        visit_share = best_visits / float(total_visits)
+        score_lead = 1.0 if runner_up_score is None else (best_score - runner_up_score) / SCORE_DIFF_NORMALIZER
+        self.confidence = (visit_share + max(0.0, min(1.0, score_lead))) / 2
+
+    def clinched(self, root_moves, remaining):
+        """True if no other move can overtake the best one within `remaining` more iterations."""
+        if len(root_moves) < self.num_moves:
+            return False  # an untried move could still score best
+        best_visits, best_value = next((visits, value) for m, visits, value in root_moves if m == self.best_move)
+        # Each move gets at most all of the iterations, so these bounds hold however they are shared
+        worst_best = (best_value + remaining * MIN_SCORE) / (best_visits + remaining)
+        for m, visits, value in root_moves:
+            if m != self.best_move and (value + remaining * MAX_SCORE) / (visits + remaining) >= worst_best:
+                return False
+        return True
+
+    def should_stop(self, tree):
+        """Called after every iteration; returns True once searching `tree` further is not worth it."""
+        if self.forced:
+            self.confidence = 1.0
+            self.stop_reason = "forced"
+            return True
+        now = time.time()
+        if self.start is None:
+            self.start = (now, tree.pool.visits[tree.root])
+        if now < self.next_check:
+            return False
+        self.next_check = now + CHECK_INTERVAL
+        root_moves = tree.root_statistics()
+        self.update(root_moves)
+
+        visits = tree.pool.visits[tree.root]
+        start_time, start_visits = self.start
+        rate = (visits - start_visits) / (now - start_time) if now > start_time else float("inf")
+        remaining = min(self.node_limit - visits, RATE_MARGIN * rate * max(0.0, self.deadline - now))
+        if now >= self.target:
+            self.stop_reason = "effort"
+        elif self.best_move is not None and self.clinched(root_moves, remaining):
+            self.stop_reason = "clinched"
+        elif not self.heuristic or now < self.earliest:
+            return False
+        elif self.confidence >= CONFIDENCE_HIGH and self.stable_checks >= STABLE_CHECKS_HIGH:
+            self.stop_reason = "confident"
+        elif self.confidence >= CONFIDENCE_MODERATE and self.stable_checks >= STABLE_CHECKS_MODERATE:
+            self.stop_reason = "confident"
+        elif self.stable_checks >= STABLE_CHECKS_LOW:
+            self.stop_reason = "stable"
+        else:
+            return False
+        return True
@@ -0,0 +1,57 @@
+from array import array
+
+from ai.node_pool import NO_HANDLE
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table mapping Game.position_hash() to node handles.
+
+    Each key maps to a single slot (key modulo size). When two positions
+    collide, the node with more visits keeps the slot, so the table favours
+    the well-explored positions that are worth sharing. A node that loses its
+    slot stays in the tree; it simply stops being shared.
+
+    `visits` is the node pool's visit buffer, used by the replacement policy.
+    """
+
+    def __init__(self, size, visits):
+        self.size = size
+        self.visits = visits
+        self.clear()
+
+    def clear(self):
+        self.keys = array("Q", [0]) * self.size
+        self.nodes = array("i", [NO_HANDLE]) * self.size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.lookups = 0
+        self.hits = 0
+        self.replacements = 0
+
+    def lookup(self, key):
+        self.lookups += 1
+        idx = key % self.size
+        node = self.nodes[idx]
+        if node != NO_HANDLE and self.keys[idx] == key:
+            self.hits += 1
+            return node
+        return NO_HANDLE
+
+    def store(self, key, node):
+        idx = key % self.size
+        current = self.nodes[idx]
+        if current != NO_HANDLE:
+            if self.visits[current] > self.visits[node]:
+                return
+            self.replacements += 1
+        self.keys[idx] = key
+        self.nodes[idx] = node
+
+    @property
+    def hit_rate(self):
+        return self.hits / float(self.lookups) if self.lookups else 0.0
+
+    def memory_bytes(self):
+        return self.size * (self.keys.itemsize + self.nodes.itemsize)
@@ -0,0 +1,95 @@
+"""
+Long-lived worker processes for parallel search.
+
+Starting processes and building score tables takes longer than a short
+search, so each kind of pool ("root" for root-parallel search, "tree" for
+the shared-tree search) is created once and reused by every later call that
+asks for the same number of workers.
+
+Several searches can use a pool at once, so a search that wants to stop its
+jobs early takes a stop slot: a flag in shared memory that its jobs poll
+with `stop_requested(slot)`.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from utils.score_tables import get_score_tables
+
+MAX_STOP_SLOTS = 64  # searches that can hold a stop slot at once
+
+_executors = {}  # kind -> (executor, workers)
+_lock = threading.Lock()
+_stop_flags = multiprocessing.Array("b", MAX_STOP_SLOTS, lock=False)
+_free_stop_slots = list(range(MAX_STOP_SLOTS))
+_stop_slot_available = threading.Condition()
+
+
+def _init_worker(agent_id, stop_flags, initializer, initargs):
+    global _stop_flags
+    _stop_flags = stop_flags
+    get_score_tables(agent_id=agent_id)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+@contextmanager
+def stop_slot():
+    """Reserve a stop slot for the duration of one search."""
+    with _stop_slot_available:
+        while not _free_stop_slots:
+            _stop_slot_available.wait()
+        slot = _free_stop_slots.pop()
+    _stop_flags[slot] = 0
+    try:
+        yield slot
+    finally:
+        with _stop_slot_available:
+            _free_stop_slots.append(slot)
+            _stop_slot_available.notify()
+
+
+def request_stop(slot):
+    _stop_flags[slot] = 1
+
+
+def stop_requested(slot):
+    return _stop_flags[slot] != 0
+
+
+def _ping():
+    return True
+
+
+def get_executor(workers, agent_id='default', kind="root", initializer=None, initargs=()):
+    """Return the shared process pool of this kind, (re)creating it if the worker count changed.
+
+    `initializer(*initargs)` runs once in each new worker process, after the
+    agent's score tables are built.
+    """
+    with _lock:
+        executor, current_workers = _executors.get(kind, (None, 0))
+        if executor is None or current_workers != workers:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(agent_id, _stop_flags, initializer, initargs))
+            _executors[kind] = (executor, workers)
+        return executor
+
+
+def warm_up(workers, agent_id='default', kind="root", initializer=None, initargs=()):
+    """Start all worker processes now, so the first search does not pay for it."""
+    executor = get_executor(workers, agent_id=agent_id, kind=kind, initializer=initializer, initargs=initargs)
+    for future in [executor.submit(_ping) for _ in range(workers)]:
+        future.result()
+
+
+def shutdown(kind=None):
+    """Stop the pool of the given kind, or every pool."""
+    with _lock:
+        for k in [kind] if kind is not None else list(_executors):
+            executor, _ = _executors.pop(k, (None, 0))
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
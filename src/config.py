@@ -25,4 +25,51 @@ SCORE_DIFF_NORMALIZER = 0.2
 # Computation Distribution Settings
 COMP_DIST_FEW_MOVES = [0.4, 0.8, 1.6]
 COMP_DIST_MEDIUM_MOVES = [0.2, 0.4, 0.8]
-COMP_DIST_MANY_MOVES = [0.1, 0.2, 0.4]
\ No newline at end of file
+COMP_DIST_MANY_MOVES = [0.1, 0.2, 0.4]
+
+# Endgame Solver
+SOLVER_EMPTY_CELLS = 20  # playable cells at or below which the endgame solver runs before searching
+SOLVER_NODE_LIMIT = 500000  # nodes the solver may visit before giving up
+SOLVER_TIME_SHARE = 0.5  # share of the move's time limit the solver may use
+SOLVER_TABLE_SIZE = 1000000  # solver transposition table entries, cleared when full
+
+# Opening Book
+OPENING_BOOK_PATH = "data/opening_book.bin"
+BOOK_MAX_PLY = 12  # positions this many plies from the start or later are not kept in the book
+BOOK_MIN_VISITS = 2000  # visits a book position needs before its move is played without searching
+
+# Game Storage
+GAME_STORAGE_MODE = "log"  # "log": append each change to a per-game log; "json": rewrite the whole game file
+GAME_LOG_COMPACT_EVERY = 64  # logged changes after which a game's log is folded into its JSON checkpoint
+GAME_INDEX_FILE = "index.sqlite"  # list_games index, kept in each storage directory
+GAME_CHECKPOINT_EVERY = 8  # moves between the positions kept in a game document for restore_to_move
+RESTORE_CACHE_GAMES = 32  # games whose recently restored positions are kept in memory
+RESTORE_CACHE_POSITIONS = 64  # restored positions kept per game
+GAME_CACHE_SIZE = 256  # games the server keeps in memory (CachedGameStorage)
+GAME_CACHE_DURABILITY = "interval"  # when cached changes are written: "sync", "interval" or "shutdown"
+GAME_FLUSH_INTERVAL = 1.0  # seconds between writes of cached changes in "interval" durability
+
+# Self-Play Records
+SELF_PLAY_RECORDS_DIR = "data/self_play_records"
+RECORD_SEGMENT_BYTES = 64 * 1024 * 1024  # size at which record segments roll over to a new file
+
+# Benchmarks
+BENCHMARK_BASELINE_PATH = "data/benchmark_baseline.json"
+BENCHMARK_NODE_LIMIT = 2000  # root visits searched per benchmark position
+BENCHMARK_TOLERANCE = 0.15  # relative slowdown (or memory growth) against the baseline that counts as a regression
+
+# Server Settings
+MAX_CACHED_TREES = 16  # search trees kept between requests, least recently used evicted first
+PONDER_MAX_GAMES = 4  # games searched in the background on the human's turn
+PONDER_SECONDS_LIMIT = 60  # longest background search per turn
+PONDER_NODE_LIMIT = 200000  # root visits at which a game stops being pondered
+PONDER_CPU_SHARE = 0.5  # share of one core the background search may use
+JOB_WORKERS = 4  # move computations run at once; later requests wait in the queue
+JOB_QUEUE_SIZE = 64  # queued move computations before requests are refused
+JOB_DEADLINE_GRACE = 10  # seconds a job may wait in the queue on top of its compute_time
+JOB_MIN_SEARCH_SECONDS = 0.2  # search time a job gets even when it starts just before its deadline
+JOB_RESULT_TTL = 300  # seconds finished jobs stay available to poll
+JOB_LONG_POLL_LIMIT = 30  # longest wait a job poll may ask for
+STREAM_INTERVAL = 0.25  # seconds between search snapshots sent to streaming clients
+STREAM_KEEPALIVE = 15  # seconds of silence after which a stream sends a keep-alive comment
+METRICS_HISTORY = 1000  # latest move latencies kept per compute_time for /api/metrics percentiles
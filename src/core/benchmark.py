@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""
+Deterministic engine benchmark.
+
+Searches a fixed set of positions (opening, midgame and endgame, written as
+move sequences from the start) with seeded SearchTrees and a root-visit
+budget only, so every run does exactly the same work and only the time it
+takes can change. For each position it reports:
+
+    iterations/s    MCTS iterations (root visits) per second
+    rollouts/s      rollouts from newly expanded nodes per second
+    scores/s        Board.score evaluations per second, batched ones included
+    bytes/node      peak memory the search added to the empty tree, per node
+    move            the move the search chooses
+
+Rates use the best of `repeat` uninstrumented runs. Counts and memory come
+from one more run with counting wrappers and tracemalloc, which only works
+because the search is deterministic; a run that does not repeat exactly is
+an error.
+
+With `--save` the results become the baseline file. Otherwise they are
+compared with it: a rate that drops, or memory per node that grows, by more
+than `tolerance` is a regression and the command exits with status 1. A
+different move or number of iterations or evaluations means the search
+itself changed, which is reported but not a failure. Timings are only
+comparable on the machine that made the baseline.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import core.game as game_module
+from core.game import Board, Game
+from ai.mcts import SearchTree, search
+from ai.time_manager import best_root_move
+from utils.score_tables import get_score_tables
+from config import BENCHMARK_BASELINE_PATH, BENCHMARK_NODE_LIMIT, BENCHMARK_TOLERANCE
+
+# (name, moves from the start as board and cell digits), taken from seeded self-play games
+POSITIONS = [
+    ("opening-0", ""),
+    ("opening-4", "14411007"),
+    ("midgame-16", "14411007733004422001188008833332"),
+    ("midgame-24", "144664400443333223311552266003300556611778866772"),
+    ("endgame-30", "144664400443333223311552266003300556611778866772288227777113"),
+    ("endgame-33", "144110077330044220011880088333322102220074408775555777788667716884"),
+]
+METRICS = {  # metric -> True when higher is better
+    "iterations_per_second": True,
+    "rollouts_per_second": True,
+    "scores_per_second": True,
+    "bytes_per_node": False,
+}
+
+
+def position_game(moves):
+    """The Game reached by playing `moves` (board and cell digit pairs) from the start."""
+    game = Game()
+    for i in range(0, len(moves), 2):
+        board, cell = int(moves[i]), int(moves[i + 1])
+        if not game.make_move(board, cell, game.next_to_move):
+            raise ValueError(f"Illegal move {board}{cell} at ply {i // 2 + 1}")
+    return game
+
+
+class _Counters:
+    """Counts score evaluations and rollouts while active, by wrapping the functions that do them."""
+
+    def __enter__(self):
+        self.scores = 0
+        self.rollouts = 0
+        board_score = Board.score
+        score_children = game_module.score_children
+        expand_one_child = SearchTree.expand_one_child
+
+        def counted_score(board, player, agent_id='default'):
+            self.scores += 1
+            return board_score(board, player, agent_id)
+
+        def counted_score_children(board, moves, mover, agent_id='default'):
+            self.scores += len(moves)
+            return score_children(board, moves, mover, agent_id)
+
+        def counted_expand_one_child(tree, node):
+            self.rollouts += 1
+            return expand_one_child(tree, node)
+
+        self.originals = [(Board, "score", board_score), (game_module, "score_children", score_children),
+                          (SearchTree, "expand_one_child", expand_one_child)]
+        Board.score = counted_score
+        game_module.score_children = counted_score_children
+        SearchTree.expand_one_child = counted_expand_one_child
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, original in self.originals:
+            setattr(owner, name, original)
+
+
+def _search(game, agent_id, node_limit, seed):
+    tree = SearchTree(game.copy(), agent_id=agent_id, seed=seed)
+    start_time = time.perf_counter()
+    search(tree, time.time(), float("inf"), node_limit)
+    return tree, time.perf_counter() - start_time
+
+
+def benchmark_position(moves, agent_id='default', node_limit=BENCHMARK_NODE_LIMIT, seed=0, repeat=3):
+    """Measurements of a seeded, node-limited search of the position reached by `moves`."""
+    game = position_game(moves)
+    seconds = float("inf")
+    for _ in range(repeat):
+        tree, elapsed = _search(game, agent_id, node_limit, seed)
+        seconds = min(seconds, elapsed)
+    iterations = tree.pool.visits[tree.root]
+    move, score = best_root_move(tree.root_statistics())
+
+    tracemalloc.start()
+    try:
+        counted = SearchTree(game.copy(), agent_id=agent_id, seed=seed)
+        # Only count what the search adds to the empty tree, not the fixed-size transposition table
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        with _Counters() as counters:
+            search(counted, time.time(), float("inf"), node_limit)
+        peak = tracemalloc.get_traced_memory()[1] - start_memory
+    finally:
+        tracemalloc.stop()
+    if counted.pool.visits[counted.root] != iterations or best_root_move(counted.root_statistics())[0] != move:
+        raise RuntimeError("The seeded search did not repeat exactly; the benchmark cannot be trusted")
+
+    return {
+        "ply": len(moves) // 2,
+        "iterations": iterations,
+        "rollouts": counters.rollouts,
+        "scores": counters.scores,
+        "tree_nodes": counted.pool.num_nodes,
+        "seconds": seconds,
+        "iterations_per_second": iterations / seconds,
+        "rollouts_per_second": counters.rollouts / seconds,
+        "scores_per_second": counters.scores / seconds,
+        "bytes_per_node": peak / counted.pool.num_nodes,
+        "move": list(move) if move is not None else None,
+        "score": score
+    }
+
+
+def run_benchmark(agent_id='default', node_limit=BENCHMARK_NODE_LIMIT, seed=0, repeat=3, names=None):
+    """Benchmark every position in POSITIONS (or those in `names`). Returns the settings and per-position results."""
+    positions = [(name, moves) for name, moves in POSITIONS if names is None or name in names]
+    # Load the agent's tables before timing anything
+    get_score_tables(agent_id=agent_id)
+    results = {}
+    for name, moves in positions:
+        results[name] = benchmark_position(moves, agent_id, node_limit, seed, repeat)
+        print_result(name, results[name])
+    return {
+        "settings": {"agent_id": agent_id, "node_limit": node_limit, "seed": seed},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.machine()},
+        "positions": results
+    }
+
+
+def print_result(name, result):
+    move = f"{result['move'][0]},{result['move'][1]}" if result["move"] is not None else "-"
+    print(f"{name:<12}{result['iterations']:>8} it {result['iterations_per_second']:>9.0f} it/s "
+          f"{result['rollouts_per_second']:>9.0f} rollouts/s {result['scores_per_second']:>10.0f} scores/s "
+          f"{result['bytes_per_node']:>7.0f} B/node  move {move}")
+
+
+def compare(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """(regressions, changes) of `results` against `baseline`, as messages.
+
+    Raises ValueError when the two were not run with the same settings.
+    """
+    if results["settings"] != baseline["settings"]:
+        raise ValueError(f"Baseline settings {baseline['settings']} differ from this run's {results['settings']}")
+    regressions = []
+    changes = []
+    for name, result in results["positions"].items():
+        base = baseline["positions"].get(name)
+        if base is None:
+            changes.append(f"{name}: not in the baseline")
+            continue
+        for key in ("move", "iterations", "scores"):
+            if result[key] != base[key]:
+                changes.append(f"{name}: {key} changed from {base[key]} to {result[key]}")
+        for metric, higher_is_better in METRICS.items():
+            ratio = result[metric] / base[metric] if base[metric] else 1.0
+            change = ratio - 1 if higher_is_better else 1 - ratio
+            if change < -tolerance:
+                regressions.append(f"{name}: {metric} {base[metric]:.0f} -> {result[metric]:.0f} ({ratio - 1:+.1%})")
+    return regressions, changes
+
+
+def load_baseline(path=BENCHMARK_BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BENCHMARK_BASELINE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search on fixed positions and check for regressions")
+    parser.add_argument("--agent", type=str, default="default", help="Agent ID to search with")
+    parser.add_argument("--nodes", type=int, default=BENCHMARK_NODE_LIMIT, help="Root visits per position")
+    parser.add_argument("--seed", type=int, default=0, help="Search seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per position; the fastest counts")
+    parser.add_argument("--positions", type=str, nargs="+", help="Benchmark only these positions")
+    parser.add_argument("--baseline", type=str, default=BENCHMARK_BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE,
+                        help="Relative slowdown that counts as a regression")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    args = parser.parse_args()
+
+    unknown = set(args.positions or ()) - {name for name, _ in POSITIONS}
+    if unknown:
+        parser.error(f"Unknown positions: {', '.join(sorted(unknown))}")
+
+    results = run_benchmark(args.agent, args.nodes, args.seed, args.repeat, args.positions)
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Saved the baseline to {args.baseline}")
+        sys.exit(0)
+
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+        sys.exit(1)
+    baseline = load_baseline(args.baseline)
+    if baseline.get("machine") != results["machine"]:
+        print(f"Warning: the baseline was made on {baseline.get('machine')}, so timings may not be comparable")
+    try:
+        regressions, changes = compare(results, baseline, args.tolerance)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    for message in changes:
+        print(f"Changed: {message}")
+    if regressions:
+        print(f"\nREGRESSION beyond {args.tolerance:.0%} against {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
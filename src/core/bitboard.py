@@ -0,0 +1,63 @@
+"""
+Bitboard primitives for the game engine.
+
+A tic-tac-toe grid (a mini-board, or the global board of mini-board winners)
+is stored as two 9-bit integers, one per player, where bit ``k`` is set when
+that player holds cell ``k``:
+
+    0 | 1 | 2
+    ---------
+    3 | 4 | 5
+    ---------
+    6 | 7 | 8
+
+Everything a move needs to know about a grid is precomputed over all 512
+possible masks, so make/undo are a handful of integer operations.
+"""
+import random
+
+from utils.utils import LINES
+
+FULL_MASK = (1 << 9) - 1
+CELL_BITS = tuple(1 << k for k in range(9))
+WIN_MASKS = tuple(sum(1 << k for k in line) for line in LINES)
+
+# HAS_LINE[mask] is True when the mask contains at least one winning line
+HAS_LINE = tuple(any(mask & w == w for w in WIN_MASKS) for mask in range(1 << 9))
+
+# EMPTY_CELLS[occupied] lists the free cell indices, in ascending order
+EMPTY_CELLS = tuple(tuple(k for k in range(9) if not mask >> k & 1) for mask in range(1 << 9))
+
+
+def mask_winner(x_mask, o_mask):
+    """Return "x" or "o" if that player has three in a row, else ""."""
+    if HAS_LINE[x_mask]:
+        return "x"
+    if HAS_LINE[o_mask]:
+        return "o"
+    return ""
+
+
+def masks_from_cells(cells):
+    """Convert a list of 9 "x"/"o"/"" cells into an (x_mask, o_mask) pair."""
+    x_mask = o_mask = 0
+    for k, c in enumerate(cells):
+        if c == "x":
+            x_mask |= CELL_BITS[k]
+        elif c == "o":
+            o_mask |= CELL_BITS[k]
+    return x_mask, o_mask
+
+
+def cells_from_masks(x_mask, o_mask):
+    """Convert an (x_mask, o_mask) pair back into a list of 9 cells."""
+    return ["x" if x_mask >> k & 1 else "o" if o_mask >> k & 1 else "" for k in range(9)]
+
+
+# Zobrist keys: one per (player, board * 9 + cell), one per forced target
+# board (index 9 meaning "play anywhere") and one for "o" to move. A fixed
+# seed keeps hashes stable across processes.
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_CELLS = {p: tuple(_zobrist_rng.getrandbits(64) for _ in range(81)) for p in ("x", "o")}
+ZOBRIST_TARGET = tuple(_zobrist_rng.getrandbits(64) for _ in range(10))
+ZOBRIST_O_TO_MOVE = _zobrist_rng.getrandbits(64)
@@ -1,19 +1,33 @@
-import itertools
+from utils.utils import three_in_a_row
+from core.evaluator import ScoreEvaluator, score_children, np
+from core.bitboard import (FULL_MASK, CELL_BITS, EMPTY_CELLS, ZOBRIST_CELLS, ZOBRIST_TARGET,
+                           ZOBRIST_O_TO_MOVE, mask_winner, masks_from_cells, cells_from_masks)
+
+# Fewest legal moves for which greedy_next_move scores all candidates in one NumPy batch
+BATCHED_GREEDY_MIN_MOVES = 8
 
-from utils.utils import three_in_a_row, load_agent_config
-from utils.game_score_utils import score_board, calculate_square_importance
 
 class MiniBoard:
     def __init__(self):
-        self.cells = ["" for _ in range(9)]
+        self.x = 0  # bitmask of cells held by "x"
+        self.o = 0  # bitmask of cells held by "o"
         self.winner = ""  # either "", "x", or "o"
 
+    @property
+    def cells(self):
+        # A tuple, so writing to a cell fails instead of changing a copy; assign the whole list instead
+        return tuple(cells_from_masks(self.x, self.o))
+
+    @cells.setter
+    def cells(self, cells):
+        self.x, self.o = masks_from_cells(cells)
+
     def evaluate_winner(self):
-        return three_in_a_row(self.cells)
+        return mask_winner(self.x, self.o)
 
     def legal_cells(self):
         if self.winner == "":
-            return [i for i, c in enumerate(self.cells) if c == ""]
+            return list(EMPTY_CELLS[self.x | self.o])
         else:
             return []
 
@@ -22,11 +36,33 @@ class Board:
     def __init__(self):
         self.boards = [MiniBoard() for _ in range(9)]
         self.winner = ""
+        self.x_won = 0  # bitmask of mini-boards won by "x"
+        self.o_won = 0  # bitmask of mini-boards won by "o"
+        self.decided = 0  # bitmask of mini-boards that are won or full
+        self.evaluators = {}  # agent_id -> ScoreEvaluator caching Board.score terms
 
     def evaluate_winner(self):
         boards = [b.winner for b in self.boards]
         return three_in_a_row(boards)
 
+    def update_board(self, i):
+        """Refresh mini-board i's winner, the global masks and the overall winner after mini-board i changed."""
+        mini = self.boards[i]
+        bit = CELL_BITS[i]
+        mini.winner = mask_winner(mini.x, mini.o)
+        self.x_won &= ~bit
+        self.o_won &= ~bit
+        self.decided &= ~bit
+        if mini.winner == "x":
+            self.x_won |= bit
+        elif mini.winner == "o":
+            self.o_won |= bit
+        if mini.winner != "" or mini.x | mini.o == FULL_MASK:
+            self.decided |= bit
+        self.winner = mask_winner(self.x_won, self.o_won)
+        for evaluator in self.evaluators.values():
+            evaluator.dirty |= bit
+
     def score(self, player, agent_id='default'):
         """
         Score a UTTT board position combining global winning potential with strategic control.
@@ -44,51 +80,11 @@ class Board:
         if self.winner == opponent:
             return 0.0
 
-        # Load additional configuration parameters for board scoring
-        config = load_agent_config(agent_id=agent_id)
-        global_score_weight   = float(config.get("global_score_weight", 0.65))
-        strategic_score_weight = float(config.get("strategic_score_weight", 0.35))
-        offensive_weight      = float(config.get("offensive_weight", 0.7))
-        defensive_weight      = float(config.get("defensive_weight", 0.3))
-        final_max_score       = float(config.get("final_max_score", 0.9))
-
-        # Global board state
-        global_board = [b.winner for b in self.boards]
-        global_importance_player, global_importance_opp = calculate_square_importance(global_board, agent_id=agent_id)
-        global_score = score_board(global_board, player, agent_id=agent_id)
-
-        # Calculate strategic control score
-        strategic_score = 0.0
-        total_weight = 0.0
-
-        for i, mini_board in enumerate(self.boards):
-            if mini_board.winner != "":
-                continue
-
-            # Evaluate mini-board potentials
-            winnability_player = score_board(mini_board.cells, player, agent_id=agent_id)
-            winnability_opp    = score_board(mini_board.cells, opponent, agent_id=agent_id)
-
-            # Weight based on global importance
-            board_importance = max(global_importance_player[i], global_importance_opp[i])
-
-            # Combine offensive and defensive potentials
-            board_score = (offensive_weight * winnability_player * global_importance_player[i] -
-                           defensive_weight * winnability_opp * global_importance_opp[i])
-            strategic_score += board_score * board_importance
-            total_weight += board_importance
-
-        # Normalize the strategic score
-        if total_weight > 0:
-            strategic_score = (strategic_score / total_weight + 1) / 2
-        else:
-            strategic_score = 0.0
-
-        # Combine the global and strategic scores using the configured weights
-        final_score = global_score_weight * global_score + strategic_score_weight * strategic_score
-
-        # Clamp the score so that wins remain at 1.0 and the rest falls in [0, final_max_score]
-        return max(0.0, min(final_max_score, final_score))
+        # Non-terminal positions are scored by the board's cached, incremental evaluator
+        evaluator = self.evaluators.get(agent_id)
+        if evaluator is None:
+            evaluator = self.evaluators[agent_id] = ScoreEvaluator(self, agent_id=agent_id)
+        return evaluator.score(player)
 
     def __str__(self):
         """
@@ -126,58 +122,133 @@ class Game:
         self.board = Board()
         self.move_stack = [] # tuple (i,j,s) meaning s was placed on position j in board i.
         self.next_to_move = "x"
+        self.hash = 0  # Zobrist hash of the pieces on the board, kept up to date by make/undo
+        # Calls on this game, reported in the search statistics
+        self.make_move_calls = 0
+        self.undo_calls = 0
+        self.legal_moves_calls = 0
+        self.batched_score_calls = 0  # positions scored by score_children in greedy_next_move
 
     def evaluate_winners(self):
         """Evaluate and update all winners based on current board state"""
-        for board in self.board.boards:
-            board.winner = board.evaluate_winner()
-        self.board.winner = self.board.evaluate_winner()
+        for i in range(9):
+            self.board.update_board(i)
+
+    def compute_hash(self):
+        """Zobrist hash of the pieces on the board, computed from scratch"""
+        h = 0
+        for i, mini in enumerate(self.board.boards):
+            for j in range(9):
+                if mini.x >> j & 1:
+                    h ^= ZOBRIST_CELLS["x"][i * 9 + j]
+                elif mini.o >> j & 1:
+                    h ^= ZOBRIST_CELLS["o"][i * 9 + j]
+        return h
+
+    def position_hash(self):
+        """Hash identifying the position: pieces, forced target board and side to move"""
+        target = 9
+        if self.move_stack:
+            last_cell = self.move_stack[-1][1]
+            if not self.board.decided >> last_cell & 1:
+                target = last_cell
+        h = self.hash ^ ZOBRIST_TARGET[target]
+        if self.next_to_move == "o":
+            h ^= ZOBRIST_O_TO_MOVE
+        return h
+
+    def copy(self):
+        """Independent copy of this game"""
+        g = Game()
+        for mini, source in zip(g.board.boards, self.board.boards):
+            mini.x, mini.o = source.x, source.o
+        g.evaluate_winners()
+        g.move_stack = list(self.move_stack)
+        g.next_to_move = self.next_to_move
+        g.hash = self.hash
+        return g
 
     def legal_moves(self):
+        self.legal_moves_calls += 1
+        board = self.board
         # if the game is over, stop returning legal moves
-        if self.board.winner != "":
+        if board.winner != "":
             return []
 
-        # Get last move from stack
-        last_move = self.move_stack[-1] if self.move_stack else None
-
-        # if it's the first move, the target board is won, or the target board is full, go anywhere
-        if (last_move is None or
-                (self.board.boards[last_move[1]].winner != "") or
-                len(self.board.boards[last_move[1]].legal_cells()) == 0):
-            return list(itertools.chain(*[[(i, j) for j in self.board.boards[i].legal_cells()]
-                                          for i in range(9)]))
-        else:
-            # Must play in the board corresponding to the last move's cell
-            return [(last_move[1], x) for x in self.board.boards[last_move[1]].legal_cells()]
+        # Must play in the board corresponding to the last move's cell, unless
+        # it's the first move or the target board is won or full
+        if self.move_stack:
+            target = self.move_stack[-1][1]
+            if not board.decided >> target & 1:
+                mini = board.boards[target]
+                return [(target, j) for j in EMPTY_CELLS[mini.x | mini.o]]
+
+        # go anywhere
+        return [(i, j)
+                for i, mini in enumerate(board.boards) if not board.decided >> i & 1
+                for j in EMPTY_CELLS[mini.x | mini.o]]
+
+    def is_legal_move(self, i, j):
+        """Check a move against the board without building the full legal move list"""
+        board = self.board
+        if board.winner != "" or i not in range(9) or j not in range(9):
+            return False
+        if board.decided >> i & 1:
+            return False
+        mini = board.boards[i]
+        if (mini.x | mini.o) >> j & 1:
+            return False
+        if self.move_stack:
+            target = self.move_stack[-1][1]
+            if target != i and not board.decided >> target & 1:
+                return False
+        return True
 
     def make_move(self, i, j, s):
+        self.make_move_calls += 1
         # check conditions to not do anything
-        if ((s != self.next_to_move) or (self.board.winner != "")):
+        if s != self.next_to_move or not self.is_legal_move(i, j):
             return False
-        legal_moves = self.legal_moves()
-        if (((i, j) not in legal_moves) or (len(legal_moves) == 0)):
-            return False
-        # edit game state
+        # edit game state; only mini-board i and the global masks can change
         self.move_stack.append((i, j, s))
-        self.board.boards[i].cells[j] = s
-        self.evaluate_winners()
+        mini = self.board.boards[i]
+        if s == "x":
+            mini.x |= CELL_BITS[j]
+        else:
+            mini.o |= CELL_BITS[j]
+        self.hash ^= ZOBRIST_CELLS[s][i * 9 + j]
+        self.board.update_board(i)
         self.next_to_move = "x" if s == "o" else "o"
         return True
 
     def undo_last_move(self):
+        self.undo_calls += 1
         if not self.move_stack:
             return False
         board_idx, cell_idx, player = self.move_stack.pop()
-        self.board.boards[board_idx].cells[cell_idx] = ""
-        self.evaluate_winners()
+        mini = self.board.boards[board_idx]
+        bit = CELL_BITS[cell_idx]
+        if mini.x & bit:
+            self.hash ^= ZOBRIST_CELLS["x"][board_idx * 9 + cell_idx]
+        elif mini.o & bit:
+            self.hash ^= ZOBRIST_CELLS["o"][board_idx * 9 + cell_idx]
+        mini.x &= ~bit
+        mini.o &= ~bit
+        self.board.update_board(board_idx)
         self.next_to_move = player
         return True
 
     def greedy_next_move(self):
+        legal_moves = self.legal_moves()
+        # Score every candidate at once when there are enough to pay for the NumPy setup;
+        # argmax picks the first best move, like the loop below
+        if np is not None and len(legal_moves) >= BATCHED_GREEDY_MIN_MOVES:
+            self.batched_score_calls += len(legal_moves)
+            return legal_moves[int(score_children(self.board, legal_moves, self.next_to_move).argmax())]
+
         best_move = None
         best_move_score = -float("inf")
-        for m in self.legal_moves():
+        for m in legal_moves:
             # Make the move directly on our current state
             self.make_move(m[0], m[1], self.next_to_move)
             # Evaluate score
@@ -201,7 +272,7 @@ class Game:
 
     def __repr__(self):
         return "{\"move stack\":{}, \"board\":{}}".format(
-            self.move_stack, [b.cells for b in self.board.boards])
+            self.move_stack, [list(b.cells) for b in self.board.boards])
 
     def __str__(self):
         # Format the game board as a string representation
@@ -232,6 +303,6 @@ def make_game(game_board, move_stack):
     g.next_to_move = "x" if move_stack[-1][2].lower() == "o" else "o"
     for i, b in enumerate(g.board.boards):
         b.cells = [l.lower() for l in game_board[i]]
-        b.winner = b.evaluate_winner()
-    g.board.winner = g.board.evaluate_winner()
+    g.evaluate_winners()
+    g.hash = g.compute_hash()
     return g
\ No newline at end of file
@@ -5,38 +5,56 @@ import time
 import os
 import sys
 from core.game import Game  # Adjust the import if necessary
-from ai.mcts import evaluate_next_move
+from ai.mcts import evaluate_next_move, SearchTree, DEFAULT_NODE_LIMIT
 from utils.game_storage import GameStorage
+from utils.score_tables import get_score_tables
 
 
-def run_self_play(agent1, agent2, compute_time):
+def play_game(agent1, agent2, seconds_limit, node_limit=DEFAULT_NODE_LIMIT, seed=None, early_stopping=True,
+              verbose=True):
     """
-    Run a self-play game between two agents.
+    Play one game between two agents without saving it.
 
     Args:
         agent1 (str): Agent id for player "x" (first mover).
         agent2 (str): Agent id for player "o".
-        compute_time (int): Seconds limit per move.
+        seconds_limit (float): Seconds limit per move.
+        node_limit (int): Search iterations limit per move.
+        seed (int): Seeds both agents' searches (None for unseeded searches).
+        early_stopping (bool): Let searches stop before their limits.
+        verbose (bool): Print progress.
 
     Returns:
         tuple: (game instance, move log)
     """
+    # Build both agents' score tables now, so the first move's search is not timed with them
+    for agent in (agent1, agent2):
+        get_score_tables(agent_id=agent)
+
     game = Game()
     moves_log = []
     move_count = 0
-    print(f"Starting self-play game: Agent 'x' = {agent1}, Agent 'o' = {agent2}")
+    # Each agent keeps its own search tree between its moves
+    seeds = {"x": seed, "o": seed + 1 if seed is not None else None}
+    trees = {p: SearchTree(game.copy(), agent_id=agent, seed=seeds[p]) for p, agent in (("x", agent1), ("o", agent2))}
+    if verbose:
+        print(f"Starting self-play game: Agent 'x' = {agent1}, Agent 'o' = {agent2}")
 
     # Game loop: play until the game is over (win or draw)
     while not game.board.winner and game.legal_moves():
         sys.stdout.flush()
         move_count += 1
         current_agent = agent1 if game.next_to_move == "x" else agent2
-        print(f"\nMove {move_count}: Player {game.next_to_move} using agent '{current_agent}'")
+        if verbose:
+            print(f"\nMove {move_count}: Player {game.next_to_move} using agent '{current_agent}'")
 
         # Evaluate the next move for the current agent.
-        move = evaluate_next_move(game, seconds_limit=compute_time, verbose=False, agent_id=current_agent)
+        move = evaluate_next_move(game, seconds_limit=seconds_limit, node_limit=node_limit, verbose=False,
+                                  agent_id=current_agent, tree=trees[game.next_to_move],
+                                  seed=seeds[game.next_to_move], early_stopping=early_stopping)
         board_idx, cell_idx, metadata = move
-        print(f"Chosen move: Board {board_idx}, Cell {cell_idx}")
+        if verbose:
+            print(f"Chosen move: Board {board_idx}, Cell {cell_idx}")
 
         # Make the move on the game.
         if not game.make_move(board_idx, cell_idx, game.next_to_move):
@@ -52,10 +70,28 @@ def run_self_play(agent1, agent2, compute_time):
         })
 
         # Print a summary of the board state.
-        if move_count % 3 == 0:
+        if verbose and move_count % 3 == 0:
             print(f"After move {move_count}, board state:")
             print(str(game))
 
+    return game, moves_log
+
+
+def run_self_play(agent1, agent2, compute_time, records_dir=None):
+    """
+    Run a self-play game between two agents.
+
+    Args:
+        agent1 (str): Agent id for player "x" (first mover).
+        agent2 (str): Agent id for player "o".
+        compute_time (int): Seconds limit per move.
+        records_dir (str): Also append the game as a binary record here (see utils.game_records).
+
+    Returns:
+        tuple: (game instance, move log)
+    """
+    game, moves_log = play_game(agent1, agent2, compute_time)
+
     # Determine the game result.
     if game.board.winner:
         result = f"{game.board.winner} wins"
@@ -76,6 +112,14 @@ def run_self_play(agent1, agent2, compute_time):
     storage.save_game(game_id, game, moves_log)
     print(f"Game saved with id: {game_id} in directory: {self_play_dir}")
 
+    if records_dir:
+        from utils.game_records import RecordWriter, record_from_moves_log
+        writer = RecordWriter(records_dir)
+        writer.append(record_from_moves_log(moves_log, game.board.winner, writer.agent_id(agent1),
+                                            writer.agent_id(agent2)))
+        writer.close()
+        print(f"Game record appended to {records_dir}")
+
     return game, moves_log
 
 
@@ -84,6 +128,7 @@ if __name__ == "__main__":
     parser.add_argument("--agent1", type=str, default="default", help="Agent ID for player 'x'")
     parser.add_argument("--agent2", type=str, default="default", help="Agent ID for player 'o'")
     parser.add_argument("--compute_time", type=int, default=5, help="Compute time per move in seconds")
+    parser.add_argument("--records", type=str, help="Also append the game to this binary record directory")
     args = parser.parse_args()
 
-    run_self_play(args.agent1, args.agent2, args.compute_time)
+    run_self_play(args.agent1, args.agent2, args.compute_time, records_dir=args.records)
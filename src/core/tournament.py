@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Batch self-play tournaments between agent profiles.
+
+A tournament is a fixed list of games. Round-robin pairs every two agents,
+gauntlet pairs one challenger with each other agent, and every pairing plays
+`games_per_pairing` games, alternating which agent plays "x". Games run in
+parallel on a process pool, one single-threaded game per process. Each move
+either runs a fixed number of search iterations (node budget: seeded, no early
+stopping, so every game can be replayed exactly) or for a fixed time.
+
+A tournament lives in `data/tournaments/<name>/`: its settings in
+tournament.json, and one line per finished game in results.jsonl, appended
+as games finish. Running a tournament whose directory exists resumes it with
+the stored settings and skips the games already in results.jsonl. Game
+records are saved to `games_dir` in the self-play format, so the opening
+book builder can read them, and with `records_dir` also appended there as
+binary records (see utils.game_records).
+
+Ratings are a Bradley-Terry fit on the Elo scale over all results, where a
+draw is half a win for each side and each pairing gets one virtual draw so
+unbeaten agents keep finite ratings. The 95% intervals come from refitting
+on games resampled with replacement.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from ai import worker_pool
+from core.self_play import play_game
+from utils.game_records import RecordWriter, record_from_moves_log
+from utils.game_storage import GameStorage
+from utils.score_tables import get_score_tables
+from utils.utils import list_agent_ids
+
+TOURNAMENTS_DIR = "data/tournaments"
+NODE_BUDGET_SECONDS_LIMIT = 3600  # time cap per move in node-budget mode, only there as a safety net
+BOOTSTRAP_SAMPLES = 200
+FIT_ITERATIONS = 200
+
+
+def schedule(agents, mode="round_robin", challenger=None, games_per_pairing=2):
+    """(agent playing "x", agent playing "o") for every game of the tournament, in order."""
+    if mode == "gauntlet":
+        pairings = [(challenger, agent) for agent in agents if agent != challenger]
+    else:
+        pairings = [(a, b) for i, a in enumerate(agents) for b in agents[i + 1:]]
+    games = []
+    for a, b in pairings:
+        for g in range(games_per_pairing):
+            games.append((a, b) if g % 2 == 0 else (b, a))
+    return games
+
+
+def _warm_agents(agents):
+    for agent in agents:
+        get_score_tables(agent_id=agent)
+
+
+def _play_scheduled_game(index, agent_x, agent_o, settings):
+    """Play and save game `index` of a tournament in a worker process. Returns its result and GameRecord."""
+    start_time = time.time()
+    if settings["node_limit"] is not None:
+        limits = {"seconds_limit": NODE_BUDGET_SECONDS_LIMIT, "node_limit": settings["node_limit"],
+                  "early_stopping": False}
+    else:
+        limits = {"seconds_limit": settings["seconds_limit"]}
+    # play_game seeds "o" with seed + 1
+    game, moves_log = play_game(agent_x, agent_o, seed=settings["seed"] + 2 * index, verbose=False, **limits)
+
+    # A game replayed after an interrupted run replaces the earlier record
+    game_id = f"{settings['name']}_{index:05d}"
+    storage = GameStorage(data_dir=settings["games_dir"])
+    storage.delete_game(game_id)
+    storage.save_game(game_id, game, moves_log)
+    result = {
+        "index": index,
+        "x": agent_x,
+        "o": agent_o,
+        "winner": game.board.winner or "draw",
+        "moves": len(moves_log),
+        "seconds": time.time() - start_time,
+        "game_id": game_id
+    }
+    # The parent process owns the record writer and fills in the agent ids
+    return result, record_from_moves_log(moves_log, game.board.winner)
+
+
+def fit_elo(results, agents, iterations=FIT_ITERATIONS):
+    """Elo rating per agent (mean 0) fitted to `results` by minorization-maximization."""
+    index = {agent: i for i, agent in enumerate(agents)}
+    n = len(agents)
+    score = [0.0] * n
+    games = [[0] * n for _ in range(n)]
+    for r in results:
+        i, j = index[r["x"]], index[r["o"]]
+        s = 1.0 if r["winner"] == "x" else 0.0 if r["winner"] == "o" else 0.5
+        score[i] += s
+        score[j] += 1 - s
+        games[i][j] += 1
+        games[j][i] += 1
+    for i in range(n):
+        for j in range(i + 1, n):
+            if games[i][j]:
+                games[i][j] += 1
+                games[j][i] += 1
+                score[i] += 0.5
+                score[j] += 0.5
+
+    strength = [1.0] * n
+    for _ in range(iterations):
+        for i in range(n):
+            denominator = sum(games[i][j] / (strength[i] + strength[j]) for j in range(n) if games[i][j])
+            if denominator > 0:
+                strength[i] = score[i] / denominator
+        # Ratings are relative, so keep the geometric mean at 1
+        mean_log = sum(math.log(s) for s in strength) / n
+        strength = [s / math.exp(mean_log) for s in strength]
+    return {agent: 400 * math.log10(strength[i]) for agent, i in index.items()}
+
+
+def confidence_intervals(results, agents, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """95% bootstrap interval of each agent's rating: {agent: (low, high)}."""
+    rng = random.Random(seed)
+    fits = [fit_elo([rng.choice(results) for _ in results], agents) for _ in range(samples)]
+    intervals = {}
+    for agent in agents:
+        ratings = sorted(fit[agent] for fit in fits)
+        intervals[agent] = (ratings[int(0.025 * (samples - 1))], ratings[int(0.975 * (samples - 1))])
+    return intervals
+
+
+def summarize(results, agents, session_games, session_seconds):
+    """Ratings, per-agent record and throughput of a tournament."""
+    elo = fit_elo(results, agents)
+    intervals = confidence_intervals(results, agents) if results else {agent: (0.0, 0.0) for agent in agents}
+    table = []
+    for agent in sorted(agents, key=lambda a: elo[a], reverse=True):
+        played = [r for r in results if agent in (r["x"], r["o"])]
+        points = sum(0.5 if r["winner"] == "draw" else float(r[r["winner"]] == agent) for r in played)
+        table.append({
+            "agent": agent,
+            "elo": elo[agent],
+            "ci_low": intervals[agent][0],
+            "ci_high": intervals[agent][1],
+            "games": len(played),
+            "score": points / len(played) if played else 0.0
+        })
+    return {
+        "ratings": table,
+        "games": len(results),
+        "draws": sum(r["winner"] == "draw" for r in results),
+        "x_wins": sum(r["winner"] == "x" for r in results),
+        "mean_moves": sum(r["moves"] for r in results) / len(results) if results else 0.0,
+        "mean_game_seconds": sum(r["seconds"] for r in results) / len(results) if results else 0.0,
+        "session_games": session_games,
+        "games_per_hour": session_games / session_seconds * 3600 if session_seconds > 0 else 0.0
+    }
+
+
+def print_summary(summary):
+    print(f"\n{'Agent':<22}{'Elo':>7}{'95% CI':>18}{'Games':>8}{'Score':>8}")
+    for row in summary["ratings"]:
+        ci = f"[{row['ci_low']:+.0f}, {row['ci_high']:+.0f}]"
+        print(f"{row['agent']:<22}{row['elo']:>+7.0f}{ci:>18}{row['games']:>8}{row['score']:>8.1%}")
+    print(f"\n{summary['games']} games: {summary['x_wins']} won by x, {summary['draws']} drawn, "
+          f"{summary['mean_moves']:.1f} moves and {summary['mean_game_seconds']:.1f}s per game")
+    print(f"This run: {summary['session_games']} games, {summary['games_per_hour']:.0f} games/hour")
+
+
+def load_results(path):
+    """Finished games from results.jsonl, dropping a line cut short by an interruption."""
+    results = {}
+    if path.exists():
+        damaged = False
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    damaged = True
+                    continue
+                results[result["index"]] = result
+        if damaged:
+            # New results are appended, so the file must end with a complete line
+            with open(path, "w") as f:
+                f.writelines(json.dumps(results[i]) + "\n" for i in sorted(results))
+    return results
+
+
+def run_tournament(name, agents=None, mode="round_robin", challenger=None, games_per_pairing=2, node_limit=None,
+                   seconds_limit=1.0, workers=1, seed=0, games_dir="data/self_play_games", records_dir=None):
+    """Play the tournament `name`, or resume it if it was started before. Returns its summary."""
+    tournament_dir = Path(TOURNAMENTS_DIR) / name
+    settings_path = tournament_dir / "tournament.json"
+    if settings_path.exists():
+        with open(settings_path) as f:
+            settings = json.load(f)
+        print(f"Resuming tournament {name} with its original settings")
+    else:
+        agents = agents or list_agent_ids()
+        if mode == "gauntlet" and challenger not in agents:
+            raise ValueError(f"Gauntlet challenger {challenger!r} is not one of the agents {agents}")
+        settings = {
+            "name": name,
+            "agents": agents,
+            "mode": mode,
+            "challenger": challenger,
+            "games_per_pairing": games_per_pairing,
+            "node_limit": node_limit,
+            "seconds_limit": None if node_limit is not None else seconds_limit,
+            "seed": seed,
+            "games_dir": games_dir,
+            "records_dir": records_dir
+        }
+        tournament_dir.mkdir(parents=True, exist_ok=True)
+        with open(settings_path, "w") as f:
+            json.dump(settings, f, indent=2)
+    Path(settings["games_dir"]).mkdir(parents=True, exist_ok=True)
+
+    games = schedule(settings["agents"], settings["mode"], settings["challenger"], settings["games_per_pairing"])
+    results_path = tournament_dir / "results.jsonl"
+    results = load_results(results_path)
+    pending = [(i, x, o) for i, (x, o) in enumerate(games) if i not in results]
+    budget = (f"{settings['node_limit']} nodes" if settings["node_limit"] is not None
+              else f"{settings['seconds_limit']}s") + " per move"
+    print(f"{len(games)} games, {len(results)} already played, {budget}, {workers} workers")
+
+    start_time = time.time()
+    session_games = 0
+    if pending:
+        executor = worker_pool.get_executor(workers, kind="tournament", initializer=_warm_agents,
+                                            initargs=(settings["agents"],))
+        futures = [executor.submit(_play_scheduled_game, i, x, o, settings) for i, x, o in pending]
+        writer = RecordWriter(settings["records_dir"]) if settings.get("records_dir") else None
+        try:
+            with open(results_path, "a") as f:
+                for future in as_completed(futures):
+                    result, record = future.result()
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+                    # After the result line, so a resumed run never records a game twice
+                    if writer is not None:
+                        record.agent_x = writer.agent_id(result["x"])
+                        record.agent_o = writer.agent_id(result["o"])
+                        writer.append(record)
+                    results[result["index"]] = result
+                    session_games += 1
+                    print(f"Game {result['index'] + 1}/{len(games)}: {result['x']} (x) vs {result['o']} (o): "
+                          f"{result['winner']} in {result['moves']} moves")
+        except KeyboardInterrupt:
+            print(f"\nInterrupted after {session_games} games; run again to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+        if writer is not None:
+            writer.close()
+        worker_pool.shutdown(kind="tournament")
+
+    summary = summarize([results[i] for i in sorted(results)], settings["agents"], session_games,
+                        time.time() - start_time)
+    with open(tournament_dir / "summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    print_summary(summary)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a self-play tournament between agents")
+    parser.add_argument("--name", type=str, default="tournament", help="Tournament name; reusing one resumes it")
+    parser.add_argument("--agents", type=str, nargs="+", help="Agent IDs (default: every agent in the config)")
+    parser.add_argument("--mode", choices=["round_robin", "gauntlet"], default="round_robin", help="Pairing scheme")
+    parser.add_argument("--challenger", type=str, help="Agent that plays every other agent in a gauntlet")
+    parser.add_argument("--games", type=int, default=2, help="Games per pairing, alternating colors")
+    parser.add_argument("--nodes", type=int, help="Search iterations per move (reproducible node-budget mode)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Seconds per move when no node budget is set")
+    parser.add_argument("--workers", type=int, default=1, help="Games played at once")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed for the games' searches")
+    parser.add_argument("--games_dir", type=str, default="data/self_play_games", help="Where game records are saved")
+    parser.add_argument("--records", type=str, help="Also append the games to this binary record directory")
+    args = parser.parse_args()
+
+    run_tournament(args.name, agents=args.agents, mode=args.mode, challenger=args.challenger,
+                   games_per_pairing=args.games, node_limit=args.nodes, seconds_limit=args.seconds,
+                   workers=args.workers, seed=args.seed, games_dir=args.games_dir, records_dir=args.records)
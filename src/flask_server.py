@@ -1,31 +1,74 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import flask_cors
 import json
 import argparse
+import os
+import queue
+import time
 
 from core.game import make_game
-from ai.mcts import evaluate_next_move
-from utils.game_storage import GameStorage
+from ai.mcts import evaluate_next_move, SearchTree, SearchTreeCache
+from ai.ponder import Ponderer
+from ai.opening_book import OpeningBook
+from ai import worker_pool
+from utils.game_cache import CachedGameStorage
+from utils.job_queue import JobQueue, DONE
+from utils.metrics import SearchMetrics
+from utils.score_tables import get_score_tables
+from config import (MAX_CACHED_TREES, PONDER_MAX_GAMES, PONDER_SECONDS_LIMIT, PONDER_NODE_LIMIT,
+                    PONDER_CPU_SHARE, JOB_WORKERS, JOB_QUEUE_SIZE, JOB_DEADLINE_GRACE, JOB_MIN_SEARCH_SECONDS,
+                    JOB_RESULT_TTL, JOB_LONG_POLL_LIMIT, STREAM_INTERVAL, STREAM_KEEPALIVE, METRICS_HISTORY,
+                    OPENING_BOOK_PATH, BOOK_MIN_VISITS)
 
 app = Flask(__name__)
-storage = GameStorage()
+storage = CachedGameStorage()
+search_trees = SearchTreeCache(max_size=MAX_CACHED_TREES)
+ponderer = Ponderer(search_trees, max_games=PONDER_MAX_GAMES, seconds_limit=PONDER_SECONDS_LIMIT,
+                    node_limit=PONDER_NODE_LIMIT, cpu_share=PONDER_CPU_SHARE)
+jobs = JobQueue(workers=JOB_WORKERS, max_depth=JOB_QUEUE_SIZE, result_ttl=JOB_RESULT_TTL)
+metrics = SearchMetrics(history=METRICS_HISTORY)
+search_workers = 1  # search processes per move, set by --workers
+search_parallelism = "root"  # "root" or "tree", set by --parallelism
+book = None  # OpeningBook, loaded from --book when the file exists
 
 
-@app.route('/api/makemove/', methods=['POST', 'OPTIONS'])
-@flask_cors.cross_origin()
-def make_move():
+def read_move_request():
+    """Parse a move request body. Returns (data, None) or (None, error response)."""
     # Handle both double-encoded and single-encoded JSON
     try:
         # Try to get the data directly
         data = request.get_json()
-        
+
         # Check if the data is a string (double-encoded JSON)
         if isinstance(data, str):
             data = json.loads(data)
     except Exception as e:
-        return jsonify({"error": f"Invalid JSON format: {str(e)}"}), 400
-        
+        return None, (jsonify({"error": f"Invalid JSON format: {str(e)}"}), 400)
+    return data, None
+
+
+def submit_move_job(data):
+    """Queue the computer's reply to a move request. Returns (job, None) or (None, error response)."""
+    compute_time = int(data["compute_time"])
+
+    def run(job):
+        # A job started just before its deadline still searches briefly rather than not at all
+        return compute_move(data, max(JOB_MIN_SEARCH_SECONDS, min(compute_time, job.time_left())), job)
+
+    try:
+        job = jobs.submit(run, deadline=time.time() + compute_time + JOB_DEADLINE_GRACE)
+    except queue.Full:
+        return None, (jsonify({"error": "Server busy, too many moves queued"}), 503)
+    return job, None
+
+
+def compute_move(data, seconds_limit, job=None):
+    """Play the computer's reply to the human move in `data`, searching for up to `seconds_limit`.
+
+    When run as `job`, search snapshots are published on it and a stop request plays the best move so far.
+    """
     game_id = data.get("game_id")
+    requested_at = job.submitted_at if job is not None else time.time()
 
     # Create game instance from current board state after human move
     g = make_game(data["game_board"],
@@ -37,8 +80,23 @@ def make_move():
     if game_id:
         storage.save_game(game_id, g, None)  # No metadata for human moves
 
-    # Get computer's move
-    m = evaluate_next_move(g, seconds_limit=int(data["compute_time"]), verbose=False)
+    # Get computer's move, continuing the search pondered or kept from this game's previous request
+    tree = (ponderer.stop(game_id) or search_trees.take(game_id) or SearchTree(g.copy())) if game_id else None
+    def on_progress(snapshot):
+        job.publish(snapshot)
+        return job.stop_requested.is_set()
+
+    with ponderer.paused():
+        m = evaluate_next_move(g, seconds_limit=seconds_limit, verbose=False, tree=tree,
+                               workers=search_workers, parallelism=search_parallelism,
+                               early_stopping=not data.get("force_full_time", False),
+                               stop_heuristic=data.get("stop_heuristic", False),
+                               on_progress=on_progress if job is not None else None,
+                               progress_interval=STREAM_INTERVAL, book=book)
+    if game_id:
+        # Keep searching on the human's turn
+        tree.advance((m[0], m[1]))
+        ponderer.start(game_id, tree)
 
     # Apply computer's move and record it as the last move
     g.make_move(m[0], m[1], g.next_to_move)
@@ -48,7 +106,103 @@ def make_move():
     if game_id:
         storage.save_game(game_id, g, m[2])
 
-    res = {"board": m[0], "cell": m[1], "metadata": m[2]}
+    metrics.record(int(data["compute_time"]), time.time() - requested_at, m[2])
+    return {"board": m[0], "cell": m[1], "metadata": m[2]}
+
+
+@app.route('/api/makemove/', methods=['POST', 'OPTIONS'])
+@flask_cors.cross_origin()
+def make_move():
+    data, error = read_move_request()
+    if error:
+        return error
+
+    # Runs on the job queue like /api/jobs, so concurrent searches stay bounded
+    job, error = submit_move_job(data)
+    if error:
+        return error
+    job.wait()
+    if job.status != DONE:
+        return jsonify({"error": job.error}), 500
+    return jsonify(job.result)
+
+
+@app.route('/api/jobs/makemove', methods=['POST', 'OPTIONS'])
+@flask_cors.cross_origin()
+def submit_move():
+    """Queue a move computation and return its job id without waiting for the search"""
+    data, error = read_move_request()
+    if error:
+        return error
+    job, error = submit_move_job(data)
+    if error:
+        return error
+    res = job.to_dict()
+    res["queue_depth"] = jobs.stats()["queue_depth"]
+    return jsonify(res), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@flask_cors.cross_origin()
+def get_job(job_id):
+    """Job status, and the move once it is done. `?wait=N` long-polls up to N seconds for the result."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    wait = min(float(request.args.get('wait', 0)), JOB_LONG_POLL_LIMIT)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+@flask_cors.cross_origin()
+def stream_job(job_id):
+    """Server-Sent Events: a `progress` event per search snapshot, then a `done` event with the job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        version = 0
+        while True:
+            progress, version, finished = job.next_progress(version, timeout=STREAM_KEEPALIVE)
+            if progress is not None:
+                yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+            if finished:
+                yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+            if progress is None:
+                yield ": keep-alive\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/api/jobs/<job_id>/playnow', methods=['POST', 'OPTIONS'])
+@flask_cors.cross_origin()
+def play_now(job_id):
+    """Cut the job's search short; it plays the best move found so far"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job.request_stop()
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs', methods=['GET'])
+@flask_cors.cross_origin()
+def job_stats():
+    """Queue depth, running jobs and recent queue wait times"""
+    return jsonify(jobs.stats())
+
+
+@app.route('/api/metrics', methods=['GET'])
+@flask_cors.cross_origin()
+def get_metrics():
+    """Move latency percentiles and search phase statistics per compute_time, plus the job queue's stats"""
+    res = metrics.snapshot()
+    res["jobs"] = jobs.stats()
     return jsonify(res)
 
 
@@ -57,7 +211,15 @@ def make_move():
 def list_games():
     # Only show in-progress games by default
     in_progress = request.args.get('in_progress', 'true').lower() == 'true'
-    games = storage.list_games(in_progress_only=in_progress)
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        games = storage.list_games(in_progress_only=in_progress, winner=request.args.get('winner'),
+                                   sort=request.args.get('sort', 'last_updated'),
+                                   descending=request.args.get('order', 'desc').lower() != 'asc',
+                                   limit=limit, offset=offset)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify(games)
 
 
@@ -155,6 +317,28 @@ def restore_snapshot(game_id, snapshot_id):
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run the UTTT Flask server')
     parser.add_argument('--port', type=int, default=5000, help='Port to run the server on')
+    parser.add_argument('--workers', type=int, default=1, help='Search processes per move')
+    parser.add_argument('--parallelism', choices=['root', 'tree'], default='root',
+                        help='Independent searches merged at the root, or one tree shared in memory')
+    parser.add_argument('--no-ponder', action='store_true', help="Don't search on the human's turn")
+    parser.add_argument('--book', type=str, default=OPENING_BOOK_PATH, help='Opening book file, used if it exists')
+    parser.add_argument('--book-min-visits', type=int, default=BOOK_MIN_VISITS,
+                        help='Visits a book position needs before its move is played without searching')
     args = parser.parse_args()
 
+    # Build the default agent's score tables and start the search workers
+    # before the first request pays for them
+    get_score_tables(agent_id='default')
+    search_workers = args.workers
+    search_parallelism = args.parallelism
+    if args.no_ponder:
+        ponderer.max_games = 0
+    if os.path.exists(args.book):
+        book = OpeningBook(args.book, min_visits=args.book_min_visits)
+        print(f"Loaded opening book {args.book} with {book.num_positions} positions")
+    if search_workers > 1 and search_parallelism == "tree":
+        from ai.shared_tree import warm_up
+        warm_up(search_workers)
+    elif search_workers > 1:
+        worker_pool.warm_up(search_workers - 1)
     app.run(debug=True, port=args.port)
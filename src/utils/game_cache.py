@@ -0,0 +1,191 @@
+"""
+Write-behind game storage for the server.
+
+CachedGameStorage keeps the documents of recently used games in memory, so
+load_game of an active game never touches the disk, and save_game and the
+snapshot methods only update the cached document and queue the change. A
+background thread writes each game's queued changes in one go, appended to
+its log as a batch, or as one document write in "json" mode.
+
+When changes reach the disk depends on `durability`:
+
+    "sync"      before the call that made them returns; the cache only saves reads
+    "interval"  within `flush_interval` seconds
+    "shutdown"  when the game leaves the cache, on flush() and on close()
+
+Changes still queued when the process dies are lost. close() runs at exit.
+The list_games index is updated at once, as with GameStorage.
+"""
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from utils.game_storage import GameStorage
+from config import GAME_CACHE_SIZE, GAME_CACHE_DURABILITY, GAME_FLUSH_INTERVAL
+
+DURABILITY = ("sync", "interval", "shutdown")
+
+
+class CachedGameStorage(GameStorage):
+    def __init__(self, data_dir: str = "data/games", cache_size: int = GAME_CACHE_SIZE,
+                 durability: str = GAME_CACHE_DURABILITY, flush_interval: float = GAME_FLUSH_INTERVAL, **kwargs):
+        if durability not in DURABILITY:
+            raise ValueError(f"Unknown durability {durability!r}, expected one of {', '.join(DURABILITY)}")
+        self.cache_size = cache_size
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self._cache = OrderedDict()  # game_id -> game document, least recently used first
+        self._pending = {}  # game_id -> changes not yet on disk, in order
+        self._cache_lock = threading.Lock()
+        self._flush_lock = threading.RLock()  # held while a game's files change
+        self._closed = threading.Event()
+        self._flusher = None
+        super().__init__(data_dir, **kwargs)
+        # Build the index now, while nothing is queued, so the first listing is fast and complete
+        self._index_execute("SELECT 1", create=True)
+        if durability == "interval":
+            self._flusher = threading.Thread(target=self._run, name="game-flusher", daemon=True)
+            self._flusher.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _copy(game_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Moves and snapshots are never changed once added, so copying the lists is enough
+        return {**game_data, "moves": list(game_data["moves"]), "snapshots": list(game_data["snapshots"])}
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing games: {e}")
+
+    def _flush_game(self, game_id: str) -> None:
+        """Write the game's queued changes"""
+        with self._flush_lock:
+            with self._cache_lock:
+                events = self._pending.get(game_id)
+                if not events:
+                    return
+                # An empty queue keeps the game from being evicted, and so read from disk, until it is written
+                self._pending[game_id] = []
+                game_data = self._copy(self._cache[game_id])
+            try:
+                if self.mode == "log" and self._path(game_id).exists():
+                    self._append(game_id, events)
+                else:
+                    # Not on disk yet, or "json" mode: the document holds every change
+                    self._rewrite(game_id, game_data)
+            except Exception:
+                with self._cache_lock:
+                    self._pending[game_id] = events + self._pending[game_id]
+                raise
+            with self._cache_lock:
+                if not self._pending[game_id]:
+                    del self._pending[game_id]
+
+    def flush(self) -> None:
+        """Write every queued change"""
+        with self._cache_lock:
+            game_ids = list(self._pending)
+        for game_id in game_ids:
+            self._flush_game(game_id)
+        self._shrink()
+
+    def close(self) -> None:
+        """Stop the background flusher and write every queued change"""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _shrink(self) -> None:
+        """Drop least recently used games until the cache fits, writing their changes first"""
+        while True:
+            with self._cache_lock:
+                if len(self._cache) <= self.cache_size:
+                    return
+                game_id = next(iter(self._cache))
+                if game_id not in self._pending:
+                    del self._cache[game_id]
+                    continue
+            self._flush_game(game_id)
+            with self._cache_lock:
+                if game_id in self._pending:
+                    # Changed again meanwhile, so it is in use after all
+                    self._cache.move_to_end(game_id)
+                else:
+                    self._cache.pop(game_id, None)
+
+    def _save(self, game_id: str, game_data: Dict[str, Any], event: Dict[str, Any]) -> None:
+        """Queue a change: `game_data` is the game with `event` applied"""
+        with self._cache_lock:
+            cached = self._cache.get(game_id)
+            if cached is None:
+                self._cache[game_id] = game_data
+            else:
+                # Apply to the cached document, which may have changed since `game_data` was loaded
+                self._apply(cached, event)
+                self._cache.move_to_end(game_id)
+            self._pending.setdefault(game_id, []).append(event)
+        if self.durability == "sync":
+            self._flush_game(game_id)
+        self._shrink()
+
+    def save_game(self, game_id: str, game_state: Dict[str, Any], move_metadata: Optional[Dict] = None) -> None:
+        """Save game state and optional move metadata with enhanced tracking"""
+        event = self._move_event(game_state, move_metadata)
+        game_data = self._load_full_game(game_id) or {
+            "game_id": game_id,
+            "moves": [],
+            "current_state": {},
+            "snapshots": []
+        }
+        self._apply(game_data, event)
+        self._save(game_id, game_data, event)
+        self._index_game(game_data)
+
+    def _load_full_game(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """The game's whole document, from the cache if it is there"""
+        with self._cache_lock:
+            cached = self._cache.get(game_id)
+            if cached is not None:
+                self._cache.move_to_end(game_id)
+                return self._copy(cached)
+
+        game_data = self._read_game(game_id)
+        if game_data is None:
+            return None
+        with self._cache_lock:
+            game_data = self._copy(self._cache.setdefault(game_id, game_data))
+        self._shrink()
+        return game_data
+
+    def delete_game(self, game_id: str) -> None:
+        """Remove a game from the cache, along with its document and log"""
+        with self._flush_lock:
+            with self._cache_lock:
+                self._cache.pop(game_id, None)
+                self._pending.pop(game_id, None)
+            super().delete_game(game_id)
+
+    def rename_game(self, game_id: str, new_name: str) -> bool:
+        """Create a new save file with new game_id"""
+        with self._flush_lock:
+            self._flush_game(game_id)
+            with self._cache_lock:
+                self._cache.pop(new_name, None)
+                self._pending.pop(new_name, None)
+            return super().rename_game(game_id, new_name)
+
+    def compact(self, game_id: str) -> bool:
+        """Fold the game's log, and its queued changes, into its checkpoint"""
+        with self._flush_lock:
+            self._flush_game(game_id)
+            return super().compact(game_id)
+
+    def rebuild_index(self) -> int:
+        """Rebuild the list_games index from the games on disk, after writing every queued change"""
+        self.flush()
+        return super().rebuild_index()
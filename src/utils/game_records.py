@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""
+Compact binary records of self-play games.
+
+A record stores one finished game in a few dozen bytes:
+
+    header   body length, move count, result, flags, agent id of "x" and of "o"
+    moves    one byte per move, board * 9 + cell
+    visits   only with the VISITS flag: for each move, the number of root
+             moves, then each one's move byte and its share of the root
+             visits quantized to 0-255
+
+Agent ids index agents.json in the record directory, one entry per agent
+profile and configuration, so older records keep their meaning when a
+profile is retuned.
+
+Records are appended to segment files (records-00000.seg, ...); a new
+segment starts once the current one reaches `segment_bytes`. Next to each
+segment, an index (.idx) holds the byte offset of each of its records as a
+little-endian u64, so record n can be read without a scan. Records are
+written before their index entry, and opening a RecordWriter truncates the
+segment after its last indexed record, which is all an interrupted append
+can leave behind. One writer may append to a directory at a time.
+
+`iter_records` streams records in order through buffered reads, so it scans
+millions of games in constant memory; visit distributions are only decoded
+when asked for.
+"""
+import argparse
+import hashlib
+import json
+import struct
+import time
+from pathlib import Path
+
+from ai.node_pool import MOVES, move_byte
+from utils.utils import load_agent_config
+from config import SELF_PLAY_RECORDS_DIR, RECORD_SEGMENT_BYTES
+
+MAGIC = b"UTTR"
+VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sH")  # magic, version
+RECORD_HEADER = struct.Struct("<IHBBHH")  # body length, moves, result, flags, agent x, agent o
+OFFSET = struct.Struct("<Q")
+DRAW, X_WINS, O_WINS = 0, 1, 2
+RESULTS = {"": DRAW, "x": X_WINS, "o": O_WINS}
+WINNERS = {DRAW: "", X_WINS: "x", O_WINS: "o"}
+VISITS = 1  # flag: the record carries root visit distributions
+READ_BUFFER = 1 << 20
+
+
+class GameRecord:
+    """One game: move bytes, result, the two agents' ids and optionally the root visit distributions."""
+
+    def __init__(self, moves, result, agent_x=0, agent_o=0, visits=None, visit_bytes=None):
+        self.moves = bytes(moves)
+        self.result = result
+        self.agent_x = agent_x
+        self.agent_o = agent_o
+        self._visits = visits  # per move, [(move byte, share 0-255)], or None
+        self._visit_bytes = visit_bytes  # the encoded visits, decoded on first use
+
+    @property
+    def winner(self):
+        return WINNERS[self.result]
+
+    @property
+    def visits(self):
+        if self._visits is None and self._visit_bytes is not None:
+            data = self._visit_bytes
+            visits = []
+            pos = 0
+            for _ in range(len(self.moves)):
+                count = data[pos]
+                visits.append([(data[pos + 1 + 2 * i], data[pos + 2 + 2 * i]) for i in range(count)])
+                pos += 1 + 2 * count
+            self._visits = visits
+        return self._visits
+
+    def move_list(self):
+        """The moves as (board, cell) tuples."""
+        return [MOVES[m] for m in self.moves]
+
+    def pack(self):
+        body = bytearray(self.moves)
+        flags = 0
+        if self._visits is None and self._visit_bytes is not None:
+            flags |= VISITS
+            body += self._visit_bytes
+        elif self._visits is not None:
+            flags |= VISITS
+            for distribution in self._visits:
+                body.append(len(distribution))
+                for m, share in distribution:
+                    body.append(m)
+                    body.append(share)
+        return RECORD_HEADER.pack(len(body), len(self.moves), self.result, flags, self.agent_x,
+                                  self.agent_o) + body
+
+    @classmethod
+    def unpack(cls, header, body):
+        _, num_moves, result, flags, agent_x, agent_o = header
+        visit_bytes = body[num_moves:] if flags & VISITS else None
+        return cls(body[:num_moves], result, agent_x, agent_o, visit_bytes=visit_bytes)
+
+
+def quantize_visits(root_moves):
+    """[(move byte, share 0-255)] from a search's (move, score, visits) root moves, dropping moves that round to 0.
+
+    Games recorded before visit counts were kept have (move, score) root moves, which give no distribution.
+    """
+    if any(len(entry) < 3 for entry in root_moves):
+        return []
+    total = sum(visits for _, _, visits in root_moves)
+    if not total:
+        return []
+    distribution = []
+    for m, _, visits in root_moves:
+        share = round(255 * visits / total)
+        if share:
+            distribution.append((move_byte(m), share))
+    return distribution
+
+
+def record_from_moves_log(moves_log, winner, agent_x=0, agent_o=0, visits=True):
+    """A GameRecord of a self-play move log (see core.self_play.play_game)."""
+    moves = [move_byte((entry["move"]["board"], entry["move"]["cell"])) for entry in moves_log]
+    distributions = None
+    if visits:
+        distributions = [quantize_visits((entry.get("metadata") or {}).get("moves") or []) for entry in moves_log]
+    return GameRecord(moves, RESULTS[winner], agent_x, agent_o, distributions)
+
+
+def segment_paths(directory):
+    return sorted(Path(directory).glob("records-*.seg"))
+
+
+def index_path(segment_path):
+    return segment_path.with_suffix(".idx")
+
+
+def _indexed_count(segment_path):
+    path = index_path(segment_path)
+    return path.stat().st_size // OFFSET.size if path.exists() else 0
+
+
+def load_agents(directory):
+    """The agents table of a record directory: [{"agent": name, "config": digest}], indexed by agent id."""
+    path = Path(directory) / "agents.json"
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def config_digest(agent):
+    return hashlib.sha1(json.dumps(load_agent_config(agent_id=agent), sort_keys=True).encode()).hexdigest()[:12]
+
+
+class RecordWriter:
+    def __init__(self, directory=SELF_PLAY_RECORDS_DIR, segment_bytes=RECORD_SEGMENT_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.agents = load_agents(directory)
+        segments = segment_paths(directory)
+        self.segment = len(segments) - 1 if segments else 0
+        self._open()
+
+    def _open(self):
+        path = self.directory / f"records-{self.segment:05d}.seg"
+        if path.exists() and path.stat().st_size >= SEGMENT_HEADER.size:
+            self._repair(path)
+        else:
+            with open(path, "wb") as f:
+                f.write(SEGMENT_HEADER.pack(MAGIC, VERSION))
+            index_path(path).write_bytes(b"")
+        self.data = open(path, "ab")
+        self.index = open(index_path(path), "ab")
+
+    def _repair(self, path):
+        """Cut the segment back to its last indexed record, and the index back to whole entries."""
+        index_path(path).touch()
+        count = _indexed_count(path)
+        with open(index_path(path), "r+b") as index, open(path, "r+b") as data:
+            index.truncate(count * OFFSET.size)
+            end = SEGMENT_HEADER.size
+            if count:
+                index.seek((count - 1) * OFFSET.size)
+                offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+                data.seek(offset)
+                end = offset + RECORD_HEADER.size + RECORD_HEADER.unpack(data.read(RECORD_HEADER.size))[0]
+            data.truncate(end)
+
+    def agent_id(self, agent):
+        """Id of `agent` with its current configuration, added to agents.json if new."""
+        entry = {"agent": agent, "config": config_digest(agent)}
+        if entry not in self.agents:
+            self.agents.append(entry)
+            path = self.directory / "agents.json"
+            temp_path = path.with_suffix(".tmp")
+            with open(temp_path, "w") as f:
+                json.dump(self.agents, f, indent=2)
+            temp_path.replace(path)
+        return self.agents.index(entry)
+
+    def append(self, record):
+        packed = record.pack()
+        if self.data.tell() > SEGMENT_HEADER.size and self.data.tell() + len(packed) > self.segment_bytes:
+            self.close()
+            self.segment += 1
+            self._open()
+        offset = self.data.tell()
+        self.data.write(packed)
+        self.data.flush()
+        self.index.write(OFFSET.pack(offset))
+        self.index.flush()
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+def count_records(directory=SELF_PLAY_RECORDS_DIR):
+    return sum(_indexed_count(path) for path in segment_paths(directory))
+
+
+def iter_records(directory=SELF_PLAY_RECORDS_DIR):
+    """Every record in the directory, in the order they were appended."""
+    for path in segment_paths(directory):
+        count = _indexed_count(path)
+        with open(path, "rb", buffering=READ_BUFFER) as f:
+            magic, version = SEGMENT_HEADER.unpack(f.read(SEGMENT_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a record segment (version {VERSION})")
+            for _ in range(count):
+                header = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                yield GameRecord.unpack(header, f.read(header[0]))
+
+
+def read_record(number, directory=SELF_PLAY_RECORDS_DIR):
+    """Record `number` (from 0, in append order), found through the segment indexes."""
+    for path in segment_paths(directory):
+        count = _indexed_count(path)
+        if number < count:
+            with open(index_path(path), "rb") as index:
+                index.seek(number * OFFSET.size)
+                offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+            with open(path, "rb") as f:
+                f.seek(offset)
+                header = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                return GameRecord.unpack(header, f.read(header[0]))
+        number -= count
+    raise IndexError("record number out of range")
+
+
+def import_games(games_dir, directory=SELF_PLAY_RECORDS_DIR, agent="default", visits=True):
+    """Append the JSON self-play games in `games_dir` as records played by `agent`. Returns the number imported."""
+    from ai.opening_book import recorded_moves
+    from core.game import Game
+    from utils.game_storage import GameStorage
+
+    storage = GameStorage(data_dir=games_dir)
+    writer = RecordWriter(directory)
+    agent_id = writer.agent_id(agent)
+    imported = 0
+    for path in sorted(Path(games_dir).glob("*.json")):
+        game_data = storage.load_game(path.stem)
+        game = Game()
+        moves_log = []
+        for board, cell, metadata in recorded_moves(game_data):
+            if not game.make_move(board, cell, game.next_to_move):
+                print(f"Illegal move in {path.name}; skipping the game")
+                break
+            moves_log.append({"move": {"board": board, "cell": cell}, "metadata": metadata})
+        else:
+            writer.append(record_from_moves_log(moves_log, game.board.winner, agent_id, agent_id, visits=visits))
+            imported += 1
+    writer.close()
+    return imported
+
+
+def print_info(directory=SELF_PLAY_RECORDS_DIR):
+    """Scan every record and print counts, results and the scan rate."""
+    start_time = time.time()
+    games = moves = 0
+    results = {DRAW: 0, X_WINS: 0, O_WINS: 0}
+    for record in iter_records(directory):
+        games += 1
+        moves += len(record.moves)
+        results[record.result] += 1
+    elapsed = time.time() - start_time
+    size = sum(path.stat().st_size for path in segment_paths(directory))
+    print(f"{games} games in {len(segment_paths(directory))} segments, {size} bytes "
+          f"({size / games if games else 0:.0f} per game), {moves / games if games else 0:.1f} moves per game")
+    print(f"x won {results[X_WINS]}, o won {results[O_WINS]}, {results[DRAW]} drawn")
+    for agent_id, entry in enumerate(load_agents(directory)):
+        print(f"agent {agent_id}: {entry['agent']} (config {entry['config']})")
+    print(f"Scanned in {elapsed:.2f}s ({games / elapsed if elapsed > 0 else 0:.0f} games/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import or inspect binary self-play records")
+    parser.add_argument("command", choices=["import", "info"], help="import JSON games, or summarize the records")
+    parser.add_argument("--records", type=str, default=SELF_PLAY_RECORDS_DIR, help="Record directory")
+    parser.add_argument("--games", type=str, default="data/self_play_games", help="JSON games to import")
+    parser.add_argument("--agent", type=str, default="default", help="Agent the imported games were played by")
+    parser.add_argument("--no_visits", action="store_true", help="Import moves and results only")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = import_games(args.games, args.records, agent=args.agent, visits=not args.no_visits)
+        print(f"Imported {count} games into {args.records}")
+    else:
+        print_info(args.records)
@@ -1,120 +1,390 @@
+"""
+Game persistence.
+
+Every game is a JSON document, `{game_id}.json`: its moves, current state and
+snapshots. In "json" mode each change rewrites the whole document. In "log"
+mode (the default) the document is only a checkpoint: each change after the
+first is appended as one line to `{game_id}.log`, so a move costs the same
+however long the game is, and load_game replays the log over the checkpoint.
+Once a log holds `compact_every` entries, it is compacted: the replayed game
+is written as the new checkpoint and the log starts over.
+
+Log lines carry the checkpoint's `log_generation`, and a compaction bumps it
+before truncating the log, so lines that a crash left behind in between are
+recognized as already folded in. A line cut short by a crash is skipped.
+
+list_games reads an SQLite index (`index.sqlite` in the data directory) with
+one row of summary fields per game, so listing never opens the game files.
+The first list_games in a directory builds the index from the games on
+disk; from then on every change made through GameStorage updates it too.
+Directories that are never listed, such as self-play output, get no index.
+rebuild_index (also `python -m utils.game_storage rebuild-index`) rebuilds
+it from scratch.
+
+Every `GAME_CHECKPOINT_EVERY` moves, the state after the move is kept in the
+document's `checkpoints`, which load_game leaves out. restore_to_move starts
+from the latest checkpoint, snapshot or recently restored position at or
+before the requested move and applies the few moves after it straight to
+the board bitmasks, without legality checks, so scrubbing through a long
+game costs the same at every move. Each game's last few restored positions
+are kept in memory.
+"""
+import argparse
 import json
+import sqlite3
+import threading
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
-from core.game import Game
+from core.bitboard import CELL_BITS, mask_winner, masks_from_cells, cells_from_masks
+from config import (GAME_STORAGE_MODE, GAME_LOG_COMPACT_EVERY, GAME_INDEX_FILE, GAME_CHECKPOINT_EVERY,
+                    RESTORE_CACHE_GAMES, RESTORE_CACHE_POSITIONS)
+
+EMPTY_STATE = {
+    "board": [["" for _ in range(9)] for _ in range(9)],
+    "last_move": None,
+    "next_to_move": "x",
+    "winner": ""
+}
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    moves INTEGER NOT NULL,
+    winner TEXT NOT NULL,
+    next_to_move TEXT,
+    created TEXT,
+    last_updated TEXT,
+    snapshots INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS games_last_updated ON games (last_updated, game_id);
+CREATE INDEX IF NOT EXISTS games_created ON games (created, game_id);
+CREATE INDEX IF NOT EXISTS games_moves ON games (moves, game_id);
+CREATE INDEX IF NOT EXISTS games_winner ON games (winner, last_updated, game_id);
+"""
+SORT_COLUMNS = ("last_updated", "created", "moves", "game_id")
 
 
 class GameStorage:
-    def __init__(self, data_dir: str = "data/games"):
+    def __init__(self, data_dir: str = "data/games", mode: str = GAME_STORAGE_MODE,
+                 compact_every: int = GAME_LOG_COMPACT_EVERY):
         """Initialize storage with configured data directory"""
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.compact_every = compact_every
+        self._logs = {}  # game_id -> [log generation, entries in the log], for games this instance appended to
+        self._lock = threading.Lock()
+        self._index = None  # connection to the list_games index, opened on first use
+        self._index_lock = threading.RLock()
+        self._restored = OrderedDict()  # game_id -> {move number: (timestamp of that move, state)}, recent games last
+        self._restored_lock = threading.Lock()
 
-    def save_game(self, game_id: str, game_state: Dict[str, Any], move_metadata: Optional[Dict] = None) -> None:
-        """Save game state and optional move metadata with enhanced tracking"""
-        path = self.data_dir / f"{game_id}.json"
+    def _connect_index(self, create: bool) -> Optional[sqlite3.Connection]:
+        """The index connection, or None when the directory has no index and `create` is False.
+
+        A new index is filled from the games on disk. Called with _index_lock held.
+        """
+        if self._index is None:
+            index_path = self.data_dir / GAME_INDEX_FILE
+            is_new = not index_path.exists()
+            if is_new and not create:
+                return None
+            index = sqlite3.connect(index_path, timeout=30, check_same_thread=False, isolation_level=None)
+            index.execute("PRAGMA journal_mode=WAL")
+            index.execute("PRAGMA synchronous=NORMAL")
+            index.executescript(INDEX_SCHEMA)
+            self._index = index
+            if is_new:
+                self._fill_index(index)
+        return self._index
+
+    def _fill_index(self, index: sqlite3.Connection) -> int:
+        rows = [self._index_row(self._read_game(path.stem)) for path in self.data_dir.glob('*.json')]
+        index.execute("BEGIN")
+        index.execute("DELETE FROM games")
+        index.executemany("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        index.execute("COMMIT")
+        return len(rows)
+
+    def _index_execute(self, sql: str, params=(), create: bool = False) -> List[tuple]:
+        """Run `sql` on the index; without `create`, a directory that has no index yet is left alone"""
+        with self._index_lock:
+            index = self._connect_index(create)
+            return index.execute(sql, params).fetchall() if index is not None else []
+
+    @staticmethod
+    def _index_row(game_data: Dict[str, Any]) -> tuple:
+        moves = game_data["moves"]
+        state = game_data["current_state"]
+        return (game_data["game_id"], len(moves), state.get("winner", ""), state.get("next_to_move"),
+                moves[0]["timestamp"] if moves else None, moves[-1]["timestamp"] if moves else None,
+                len(game_data.get("snapshots", [])))
+
+    def _index_game(self, game_data: Dict[str, Any]) -> None:
+        self._index_execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)", self._index_row(game_data))
+
+    def rebuild_index(self) -> int:
+        """Rebuild the list_games index from the games on disk. Returns the number of games indexed."""
+        with self._index_lock:
+            if self._index is None and not (self.data_dir / GAME_INDEX_FILE).exists():
+                # Creating the index fills it
+                return self._connect_index(create=True).execute("SELECT COUNT(*) FROM games").fetchone()[0]
+            return self._fill_index(self._connect_index(create=True))
+
+    def _path(self, game_id: str) -> Path:
+        return self.data_dir / f"{game_id}.json"
+
+    def _log_path(self, game_id: str) -> Path:
+        return self.data_dir / f"{game_id}.log"
+
+    def _write(self, game_id: str, game_data: Dict[str, Any]) -> None:
+        """Atomically replace the game's document"""
+        path = self._path(game_id)
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(game_data, f)
+        temp_path.replace(path)
+
+    def _rewrite(self, game_id: str, game_data: Dict[str, Any]) -> None:
+        """Replace the game's document with `game_data`, which must include any logged changes, and drop the log"""
+        with self._lock:
+            log_path = self._log_path(game_id)
+            if log_path.exists():
+                # As in a compaction, a new generation disowns the log lines if the log outlives the write
+                checkpoint = self._load_document(game_id) or {}
+                game_data = {**game_data, "log_generation": checkpoint.get("log_generation", 0) + 1}
+            self._write(game_id, game_data)
+            log_path.unlink(missing_ok=True)
+            self._logs.pop(game_id, None)
+
+    def _append(self, game_id: str, events: List[Dict[str, Any]]) -> None:
+        """Append changes to the game's log in one write, compacting the log once it is long enough"""
+        with self._lock:
+            log = self._logs.get(game_id)
+            if log is None:
+                # First append by this instance: learn the log's generation and length
+                with open(self._path(game_id)) as f:
+                    generation = json.load(f).get("log_generation", 0)
+                entries = 0
+                log_path = self._log_path(game_id)
+                if log_path.exists():
+                    with open(log_path, 'rb') as f:
+                        data = f.read()
+                    entries = data.count(b"\n")
+                    if data and not data.endswith(b"\n"):
+                        # End a line cut short by a crash, so it stays one skippable line
+                        with open(log_path, 'ab') as f:
+                            f.write(b"\n")
+                log = self._logs[game_id] = [generation, entries]
+
+            for event in events:
+                event["log_generation"] = log[0]
+            with open(self._log_path(game_id), 'a') as f:
+                f.write("".join(json.dumps(event) + "\n" for event in events))
+            log[1] += len(events)
+            if log[1] >= self.compact_every:
+                self._compact(game_id, log)
+
+    def _compact(self, game_id: str, log: List[int]) -> None:
+        game_data = self._read_game(game_id)
+        game_data["log_generation"] = log[0] + 1
+        self._write(game_id, game_data)
+        self._log_path(game_id).write_text("")
+        log[0] += 1
+        log[1] = 0
 
-        # Load existing data if available
-        if path.exists():
-            with open(path) as f:
-                game_data = json.load(f)
+    def compact(self, game_id: str) -> bool:
+        """Fold the game's log into its checkpoint"""
+        if not self._path(game_id).exists():
+            return False
+        with self._lock:
+            generation = self._load_document(game_id).get("log_generation", 0)
+            log = self._logs.setdefault(game_id, [generation, 0])
+            self._compact(game_id, log)
+        return True
+
+    def _save(self, game_id: str, game_data: Dict[str, Any], event: Dict[str, Any]) -> None:
+        """Persist a change: `game_data` is the game with `event` applied"""
+        if self.mode == "log" and self._path(game_id).exists():
+            self._append(game_id, [event])
         else:
-            game_data = {
-                "game_id": game_id,
-                "moves": [],
-                "current_state": {},
-                "snapshots": []
-            }
+            self._rewrite(game_id, game_data)
 
+    @staticmethod
+    def _move_event(game_state, move_metadata: Optional[Dict]) -> Dict[str, Any]:
+        """The change that records the last move of `game_state`"""
         # Add current move to history with timestamp
-        game_data["moves"].append({
-            "move_number": len(game_data["moves"]) + 1,
+        move = {
             "board": game_state.move_stack[-1][0],
             "cell": game_state.move_stack[-1][1],
             "player": game_state.move_stack[-1][2],
             "timestamp": datetime.now().isoformat(),
             "metadata": move_metadata if move_metadata else None
-        })
+        }
 
         # Update current state
-        game_data["current_state"] = {
-            "board": [b.cells for b in game_state.board.boards],
+        current_state = {
+            "board": [list(b.cells) for b in game_state.board.boards],
             "last_move": game_state.move_stack[-1],
             "next_to_move": game_state.next_to_move,
             "winner": game_state.board.winner
         }
+        return {"type": "move", "move": move, "state": current_state}
 
-        # Atomic write
-        temp_path = path.with_suffix('.tmp')
-        with open(temp_path, 'w') as f:
-            json.dump(game_data, f)
-        temp_path.replace(path)
+    def save_game(self, game_id: str, game_state: Dict[str, Any], move_metadata: Optional[Dict] = None) -> None:
+        """Save game state and optional move metadata with enhanced tracking"""
+        event = self._move_event(game_state, move_metadata)
+        move = event["move"]
+        current_state = event["state"]
+        if self.mode == "log" and self._path(game_id).exists():
+            # Appending needs neither the earlier moves nor their count
+            self._append(game_id, [event])
+        else:
+            # Load existing data if available, with any log left by "log" mode replayed
+            game_data = self._read_game(game_id) or {
+                "game_id": game_id,
+                "moves": [],
+                "current_state": {},
+                "snapshots": []
+            }
+            self._apply(game_data, event)
+            self._rewrite(game_id, game_data)
+
+        self._index_execute(
+            "INSERT INTO games VALUES (?, 1, ?, ?, ?, ?, 0) ON CONFLICT (game_id) DO UPDATE SET "
+            "moves = moves + 1, winner = excluded.winner, next_to_move = excluded.next_to_move, "
+            "last_updated = excluded.last_updated",
+            (game_id, current_state["winner"], current_state["next_to_move"], move["timestamp"], move["timestamp"]))
+
+    @staticmethod
+    def _apply(game_data: Dict[str, Any], event: Dict[str, Any]) -> None:
+        """Apply one logged change to a game document"""
+        kind = event["type"]
+        if kind == "move":
+            move_number = len(game_data["moves"]) + 1
+            game_data["moves"].append({"move_number": move_number, **event["move"]})
+            game_data["current_state"] = event["state"]
+            if move_number % GAME_CHECKPOINT_EVERY == 0:
+                # A new dict, so copies of the document sharing the old one are unaffected
+                game_data["checkpoints"] = {**game_data.get("checkpoints", {}), str(move_number): event["state"]}
+        elif kind == "snapshot":
+            game_data["snapshots"].append(event["snapshot"])
+        elif kind == "restore":
+            game_data["current_state"] = event["state"]
+            game_data["current_move_index"] = event["current_move_index"]
+            game_data["snapshots"].append(event["backup"])
+
+    def delete_game(self, game_id: str) -> None:
+        """Remove a game's document and log"""
+        with self._lock:
+            self._logs.pop(game_id, None)
+            self._path(game_id).unlink(missing_ok=True)
+            self._log_path(game_id).unlink(missing_ok=True)
+        self._index_execute("DELETE FROM games WHERE game_id = ?", (game_id,))
 
     def rename_game(self, game_id: str, new_name: str) -> bool:
         """Create a new save file with new game_id"""
-        old_path = self.data_dir / f"{game_id}.json"
-        if not old_path.exists():
+        if not self._path(game_id).exists():
             return False
 
         try:
-            with open(old_path) as f:
-                game_data = json.load(f)
+            game_data = self._load_full_game(game_id)
 
             # Create new save with new game_id and same content
             game_data["game_id"] = new_name  # Use the new name as the game_id
 
-            # Save to new file
-            new_path = self.data_dir / f"{new_name}.json"
-            temp_path = new_path.with_suffix('.tmp')
-            with open(temp_path, 'w') as f:
-                json.dump(game_data, f)
-            temp_path.replace(new_path)
+            # Save to new file, with any log folded in
+            with self._lock:
+                self._logs.pop(new_name, None)
+                self._log_path(new_name).unlink(missing_ok=True)
+                self._write(new_name, game_data)
+            self._index_game(game_data)
             return True
         except Exception as e:
             print(f"Error creating new save file: {e}")
             return False
 
-    def load_game(self, game_id: str) -> Optional[Dict[str, Any]]:
-        """Load game data by ID"""
-        path = self.data_dir / f"{game_id}.json"
+    def _load_document(self, game_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(game_id)
         if not path.exists():
             return None
-
         with open(path) as f:
-            game_data = json.load(f)
+            return json.load(f)
+
+    def load_game(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """Load game data by ID"""
+        game_data = self._load_full_game(game_id)
+        if game_data is not None:
+            # Checkpoints only serve restore_to_move
+            game_data.pop("checkpoints", None)
+        return game_data
+
+    def _load_full_game(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """The game's whole document, checkpoints included"""
+        return self._read_game(game_id)
+
+    def _read_game(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """The game as stored on disk: its checkpoint with the log replayed"""
+        game_data = self._load_document(game_id)
+        if game_data is None:
+            return None
             
         # Ensure snapshots field exists for backward compatibility
         if "snapshots" not in game_data:
             game_data["snapshots"] = []
-            
+
+        # Replay the changes logged since the checkpoint
+        generation = game_data.pop("log_generation", 0)
+        log_path = self._log_path(game_id)
+        if log_path.exists():
+            with open(log_path) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if event.get("log_generation") == generation:
+                        self._apply(game_data, event)
+
         return game_data
 
-    def list_games(self, in_progress_only: bool = False) -> list:
-        """List saved games with optional filtering for in-progress games only"""
-        games = []
-        for path in self.data_dir.glob('*.json'):
-            with open(path) as f:
-                data = json.load(f)
-                # Skip completed games if filtering
-                if in_progress_only and data['current_state']['winner']:
-                    continue
-
-                games.append({
-                    'game_id': data['game_id'],
-                    'moves': len(data['moves']),
-                    'winner': data['current_state']['winner'],
-                    'next_to_move': data['current_state']['next_to_move'],
-                    'in_progress': not data['current_state']['winner'],
-                    'last_updated': data['moves'][-1]['timestamp'] if data['moves'] else None
-                })
-        return games
+    def list_games(self, in_progress_only: bool = False, winner: Optional[str] = None, sort: str = "last_updated",
+                   descending: bool = True, limit: Optional[int] = None, offset: int = 0) -> list:
+        """List saved games from the index, optionally only in-progress games or those won by `winner`, a page at a time"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort games by {sort!r}")
+        conditions = []
+        params = []
+        # Skip completed games if filtering
+        if in_progress_only:
+            conditions.append("winner = ''")
+        if winner is not None:
+            conditions.append("winner = ?")
+            params.append(winner)
+        sql = "SELECT game_id, moves, winner, next_to_move, last_updated FROM games"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = "DESC" if descending else "ASC"
+        sql += f" ORDER BY {sort} {direction}, game_id {direction} LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+        rows = self._index_execute(sql, params, create=True)
+
+        return [{
+            'game_id': game_id,
+            'moves': moves,
+            'winner': game_winner,
+            'next_to_move': next_to_move,
+            'in_progress': not game_winner,
+            'last_updated': last_updated
+        } for game_id, moves, game_winner, next_to_move, last_updated in rows]
         
     def restore_to_move(self, game_id: str, move_number: int) -> Optional[Dict[str, Any]]:
         """Restore game to a specific move in history without modifying the original game data"""
-        game_data = self.load_game(game_id)
+        game_data = self._load_full_game(game_id)
         if not game_data:
             print(f"Game {game_id} not found")
             return None
@@ -143,63 +413,77 @@ class GameStorage:
                 },
                 "snapshots": game_data.get("snapshots", [])
             }
-            
-        # Create a new game state from the moves up to move_number
-        from core.game import Game, make_game
-        
-        # Initialize an empty game
-        g = Game()
-        
-        # Apply all moves up to the specified move number
-        for i in range(move_number):
-            move = game_data["moves"][i]
-            g.make_move(move["board"], move["cell"], move["player"])
-            
-        # Validate the game state
-        if not self._validate_game_state(g):
-            print(f"Warning: Game state validation failed when restoring to move {move_number}")
-            
+
         # Create a new game data object with the current state at the specified move
         # but keep all moves in the history
         restored_data = {
             "game_id": game_id,
             "moves": game_data["moves"],  # Keep all moves in history
-            "current_state": {
-                "board": [b.cells for b in g.board.boards],
-                "last_move": g.move_stack[-1] if g.move_stack else None,
-                "next_to_move": g.next_to_move,
-                "winner": g.board.winner
-            },
+            "current_state": self._position(game_id, game_data, move_number),
             "snapshots": game_data.get("snapshots", []),
             "current_move_index": move_number  # Add this to track where we are in the move history
         }
         
         return restored_data
-        
-    def _validate_game_state(self, game_state) -> bool:
-        """Validate the game state for consistency"""
-        try:
-            # Check that board winners match cell configurations
-            for i, board in enumerate(game_state.board.boards):
-                expected_winner = board.evaluate_winner()
-                if board.winner != expected_winner:
-                    print(f"Board {i} winner mismatch: {board.winner} vs {expected_winner}")
-                    return False
-                    
-            # Check that game winner matches board winners
-            expected_game_winner = game_state.board.evaluate_winner()
-            if game_state.board.winner != expected_game_winner:
-                print(f"Game winner mismatch: {game_state.board.winner} vs {expected_game_winner}")
-                return False
-                
-            return True
-        except Exception as e:
-            print(f"Error validating game state: {e}")
-            return False
+
+    def _position(self, game_id: str, game_data: Dict[str, Any], move_number: int) -> Dict[str, Any]:
+        """The state after `move_number` moves, from the closest known position at or before it"""
+        moves = game_data["moves"]
+        # Positions are remembered with the timestamp of their last move, which changes if the game is replaced
+        key = moves[move_number - 1]["timestamp"]
+        with self._restored_lock:
+            known = [(n, state) for n, (timestamp, state) in self._restored.get(game_id, {}).items()
+                     if n <= move_number and moves[n - 1]["timestamp"] == timestamp]
+        known += [(int(n), state) for n, state in game_data.get("checkpoints", {}).items() if int(n) <= move_number]
+        # A snapshot taken after a snapshot restore does not hold the position after its move number
+        known += [(s["move_number"], s["state"]) for s in game_data.get("snapshots", [])
+                  if 0 < s["move_number"] <= move_number and self._is_position(s["state"], moves[s["move_number"] - 1])]
+        start, state = max(known, key=lambda k: k[0], default=(0, EMPTY_STATE))
+        if start < move_number:
+            state = self._replay(state, moves[start:move_number])
+        self._remember(game_id, move_number, key, state)
+        return state
+
+    @staticmethod
+    def _is_position(state: Dict[str, Any], move: Dict[str, Any]) -> bool:
+        last_move = state.get("last_move")
+        return last_move is not None and list(last_move) == [move["board"], move["cell"], move["player"]]
+
+    @staticmethod
+    def _replay(state: Dict[str, Any], moves: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """`state` with `moves` applied to the board, trusting that they were legal"""
+        masks = [list(masks_from_cells(cells)) for cells in state["board"]]
+        for move in moves:
+            masks[move["board"]][move["player"] == "o"] |= CELL_BITS[move["cell"]]
+        x_won = o_won = 0
+        for i, (x, o) in enumerate(masks):
+            winner = mask_winner(x, o)
+            if winner == "x":
+                x_won |= CELL_BITS[i]
+            elif winner == "o":
+                o_won |= CELL_BITS[i]
+        last = moves[-1]
+        return {
+            "board": [cells_from_masks(x, o) for x, o in masks],
+            "last_move": (last["board"], last["cell"], last["player"]),
+            "next_to_move": "x" if last["player"] == "o" else "o",
+            "winner": mask_winner(x_won, o_won)
+        }
+
+    def _remember(self, game_id: str, move_number: int, key: str, state: Dict[str, Any]) -> None:
+        with self._restored_lock:
+            positions = self._restored.setdefault(game_id, OrderedDict())
+            self._restored.move_to_end(game_id)
+            positions[move_number] = (key, state)
+            positions.move_to_end(move_number)
+            while len(positions) > RESTORE_CACHE_POSITIONS:
+                positions.popitem(last=False)
+            while len(self._restored) > RESTORE_CACHE_GAMES:
+                self._restored.popitem(last=False)
             
     def create_snapshot(self, game_id: str, label: Optional[str] = None) -> bool:
         """Create a labeled snapshot of the current game state"""
-        game_data = self.load_game(game_id)
+        game_data = self._load_full_game(game_id)
         if not game_data:
             return False
             
@@ -216,23 +500,17 @@ class GameStorage:
             "state": game_data["current_state"].copy()
         }
         
-        # Add snapshot to game data
-        if "snapshots" not in game_data:
-            game_data["snapshots"] = []
-        game_data["snapshots"].append(snapshot)
-        
-        # Save updated game data
-        path = self.data_dir / f"{game_id}.json"
-        temp_path = path.with_suffix('.tmp')
-        with open(temp_path, 'w') as f:
-            json.dump(game_data, f)
-        temp_path.replace(path)
+        # Add snapshot to game data and save it
+        event = {"type": "snapshot", "snapshot": snapshot}
+        self._apply(game_data, event)
+        self._save(game_id, game_data, event)
+        self._index_game(game_data)
         
         return True
         
     def list_snapshots(self, game_id: str) -> List[Dict[str, Any]]:
         """List all snapshots for a game"""
-        game_data = self.load_game(game_id)
+        game_data = self._load_full_game(game_id)
         if not game_data or "snapshots" not in game_data:
             return []
             
@@ -245,7 +523,7 @@ class GameStorage:
         
     def restore_from_snapshot(self, game_id: str, snapshot_id: str) -> bool:
         """Restore a game from a snapshot without truncating move history"""
-        game_data = self.load_game(game_id)
+        game_data = self._load_full_game(game_id)
         if not game_data or "snapshots" not in game_data:
             return False
             
@@ -263,21 +541,27 @@ class GameStorage:
             "state": game_data["current_state"].copy()
         }
         
-        # Update the current state from the snapshot
-        game_data["current_state"] = snapshot["state"].copy()
-        
-        # Add current_move_index to track where we are in the move history
-        # but don't truncate the move history
-        game_data["current_move_index"] = snapshot["move_number"]
-        
-        # Add the backup to snapshots
-        game_data["snapshots"].append(backup_snapshot)
-        
-        # Save updated game data
-        path = self.data_dir / f"{game_id}.json"
-        temp_path = path.with_suffix('.tmp')
-        with open(temp_path, 'w') as f:
-            json.dump(game_data, f)
-        temp_path.replace(path)
+        # Update the current state from the snapshot, add current_move_index to track
+        # where we are in the move history (without truncating it) and keep the backup
+        event = {
+            "type": "restore",
+            "state": snapshot["state"].copy(),
+            "current_move_index": snapshot["move_number"],
+            "backup": backup_snapshot
+        }
+        self._apply(game_data, event)
+        self._save(game_id, game_data, event)
+        self._index_game(game_data)
         
         return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain a game storage directory")
+    parser.add_argument("command", choices=["rebuild-index"], help="rebuild the list_games index from the game files")
+    parser.add_argument("--data_dir", type=str, default="data/games", help="Game storage directory")
+    args = parser.parse_args()
+
+    start_time = datetime.now()
+    count = GameStorage(data_dir=args.data_dir).rebuild_index()
+    print(f"Indexed {count} games in {(datetime.now() - start_time).total_seconds():.1f}s")
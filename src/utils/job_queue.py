@@ -0,0 +1,177 @@
+"""
+Bounded job queue for move searches.
+
+Requests submit a job and get its id back immediately; a fixed number of
+worker threads take jobs in submission order. Each job has a deadline: a job
+still queued when its deadline passes expires without running, and a
+running job can ask how much time it has left so that its search finishes
+in time. Finished jobs are kept for `result_ttl` seconds so clients can
+fetch their results, then dropped.
+
+While it runs, a job can publish progress for clients to follow, and a
+client can ask it to stop early; the job polls `stop_requested` and
+finishes with what it has.
+"""
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = "queued", "running", "done", "failed", "expired"
+
+
+class Job:
+    def __init__(self, fn, deadline):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.deadline = deadline
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.finished = threading.Event()
+        self.stop_requested = threading.Event()
+        self.progress = None
+        self.progress_version = 0  # increases with every publish
+        self.progress_changed = threading.Condition()
+
+    def publish(self, progress):
+        """Make `progress` the job's latest progress report and wake anyone waiting for it."""
+        with self.progress_changed:
+            self.progress = progress
+            self.progress_version += 1
+            self.progress_changed.notify_all()
+
+    def next_progress(self, version, timeout=None):
+        """Wait until there is progress newer than `version` or the job has finished.
+
+        Returns (progress, version, finished); progress is None when nothing newer arrived in time.
+        """
+        with self.progress_changed:
+            self.progress_changed.wait_for(lambda: self.progress_version > version or self.finished.is_set(),
+                                           timeout)
+            if self.progress_version > version:
+                return self.progress, self.progress_version, self.finished.is_set()
+            return None, version, self.finished.is_set()
+
+    def request_stop(self):
+        self.stop_requested.set()
+
+    def time_left(self):
+        return self.deadline - time.time()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished or `timeout` seconds passed. Returns True if finished."""
+        return self.finished.wait(timeout)
+
+    def to_dict(self):
+        started_or_now = self.started_at if self.started_at is not None else time.time()
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "wait_time": started_or_now - self.submitted_at,
+            "run_time": self.finished_at - self.started_at if self.finished_at and self.started_at else None,
+        }
+        if self.status == DONE:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    def __init__(self, workers, max_depth, result_ttl, history=1000):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.pending = queue.Queue(maxsize=max_depth)
+        self.jobs = OrderedDict()  # by submission order
+        self.lock = threading.Lock()
+        self.running = 0
+        self.wait_times = deque(maxlen=history)  # queue wait of recently started jobs
+        self.counts = {DONE: 0, FAILED: 0, EXPIRED: 0}
+        self.threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, fn, deadline):
+        """Queue `fn(job)` to run before `deadline`. Raises queue.Full when the queue is at capacity."""
+        job = Job(fn, deadline)
+        with self.lock:
+            self._prune()
+            self.pending.put_nowait(job)
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            now = time.time()
+            queued = [job for job in self.jobs.values() if job.status == QUEUED]
+            wait_times = sorted(self.wait_times)
+
+        def percentile(p):
+            return wait_times[min(len(wait_times) - 1, int(p * len(wait_times)))] if wait_times else 0.0
+
+        return {
+            "workers": self.workers,
+            "queue_depth": len(queued),
+            "queue_capacity": self.pending.maxsize,
+            "running": self.running,
+            "oldest_queued_wait": max((now - job.submitted_at for job in queued), default=0.0),
+            "wait_time_mean": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "wait_time_p50": percentile(0.5),
+            "wait_time_p95": percentile(0.95),
+            "wait_time_max": wait_times[-1] if wait_times else 0.0,
+            "completed": self.counts[DONE],
+            "failed": self.counts[FAILED],
+            "expired": self.counts[EXPIRED]
+        }
+
+    def _prune(self):
+        # Jobs finish roughly in submission order, so stop at the first one still worth keeping
+        cutoff = time.time() - self.result_ttl
+        while self.jobs:
+            job = next(iter(self.jobs.values()))
+            if job.finished_at is None or job.finished_at > cutoff:
+                break
+            self.jobs.popitem(last=False)
+
+    def _finish(self, job, status):
+        with self.lock:
+            job.status = status
+            job.finished_at = time.time()
+            self.counts[status] += 1
+        with job.progress_changed:
+            job.finished.set()
+            job.progress_changed.notify_all()
+
+    def _work(self):
+        while True:
+            job = self.pending.get()
+            if job.time_left() <= 0:
+                job.error = "Deadline passed before the job started"
+                self._finish(job, EXPIRED)
+                continue
+
+            with self.lock:
+                job.status = RUNNING
+                job.started_at = time.time()
+                self.running += 1
+                self.wait_times.append(job.started_at - job.submitted_at)
+            try:
+                job.result = job.fn(job)
+                status = DONE
+            except Exception as e:
+                print(f"Error running job {job.id}: {e}")
+                job.error = str(e)
+                status = FAILED
+            with self.lock:
+                self.running -= 1
+            self._finish(job, status)
@@ -0,0 +1,103 @@
+"""
+Server-wide search metrics.
+
+Every move the server computes is recorded under the compute_time it was
+requested with. Each compute_time bucket keeps the latencies and thinking
+times of its last `history` moves for percentiles, and running totals of the
+per-phase search statistics from the move metadata (see
+SearchTree.search_stats), so it shows where search time goes in production.
+"""
+import threading
+import time
+from collections import deque
+
+from ai.mcts import PHASES, SEARCH_COUNTERS
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] if sorted_values else 0.0
+
+
+def distribution(values):
+    """Mean, percentiles and maximum of `values`."""
+    values = sorted(values)
+    return {
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else 0.0
+    }
+
+
+class _Bucket:
+    def __init__(self, history):
+        self.moves = 0
+        self.latencies = deque(maxlen=history)
+        self.thinking_times = deque(maxlen=history)
+        self.stop_reasons = {}
+        self.searched_moves = 0  # moves that ran a search and reported search statistics
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(SEARCH_COUNTERS, 0)
+
+    def to_dict(self):
+        counters = self.counters
+        total_seconds = sum(self.phase_seconds.values())
+        iterations = counters["iterations"]
+        return {
+            "moves": self.moves,
+            "latency": distribution(self.latencies),
+            "thinking_time": distribution(self.thinking_times),
+            "stop_reasons": dict(self.stop_reasons),
+            "searched_moves": self.searched_moves,
+            "phase_seconds": dict(self.phase_seconds),
+            "phase_share": {phase: seconds / total_seconds if total_seconds > 0 else 0.0
+                            for phase, seconds in self.phase_seconds.items()},
+            "counters": dict(counters),
+            "per_iteration": {counter: counters[counter] / float(iterations) if iterations else 0.0
+                              for counter in SEARCH_COUNTERS if counter != "iterations"},
+            "iterations_per_second": iterations / total_seconds if total_seconds > 0 else 0.0,
+            "score_cache_hit_rate": (counters["score_cache_hits"] / float(counters["score_calls"])
+                                     if counters["score_calls"] else 0.0),
+            "transposition_hit_rate": (counters["transposition_hits"] / float(counters["transposition_lookups"])
+                                       if counters["transposition_lookups"] else 0.0)
+        }
+
+
+class SearchMetrics:
+    def __init__(self, history=1000):
+        self.history = history
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.started_at = time.time()
+
+    def record(self, compute_time, latency, metadata):
+        """Add a move computed for `compute_time` that took `latency` seconds from request to reply."""
+        metadata = metadata or {}
+        stats = metadata.get("search_stats")
+        with self.lock:
+            bucket = self.buckets.get(compute_time)
+            if bucket is None:
+                bucket = self.buckets[compute_time] = _Bucket(self.history)
+            bucket.moves += 1
+            bucket.latencies.append(latency)
+            bucket.thinking_times.append(metadata.get("thinking_time", 0.0))
+            reason = metadata.get("stop_reason") or "limit"
+            bucket.stop_reasons[reason] = bucket.stop_reasons.get(reason, 0) + 1
+            if stats:
+                bucket.searched_moves += 1
+                for phase in PHASES:
+                    bucket.phase_seconds[phase] += stats["phase_seconds"][phase]
+                for counter in SEARCH_COUNTERS:
+                    bucket.counters[counter] += stats[counter]
+
+    def snapshot(self):
+        with self.lock:
+            buckets = {str(compute_time): self.buckets[compute_time].to_dict()
+                       for compute_time in sorted(self.buckets)}
+        return {
+            "uptime": time.time() - self.started_at,
+            "moves": sum(bucket["moves"] for bucket in buckets.values()),
+            "compute_time_buckets": buckets
+        }
@@ -0,0 +1,81 @@
+"""
+Precomputed lookup tables over every mini-board configuration.
+
+A 3x3 grid has only 3^9 = 19,683 configurations, so the heuristics in
+utils/game_score_utils.py are evaluated once per configuration and looked up
+afterwards. Configurations are indexed by their base-3 code, where cell ``k``
+contributes 3^k for "x" and 2 * 3^k for "o"; `board_code` builds it from the
+bitmasks kept by core.game.
+"""
+import functools
+
+from core.bitboard import CELL_BITS, mask_winner
+from utils.utils import load_agent_config, agent_profile_id
+from utils.game_score_utils import score_board, calculate_square_importance
+
+NUM_CODES = 3 ** 9
+
+# TERNARY[mask] spreads the bits of a 9-bit mask into base-3 digits
+TERNARY = tuple(sum(3 ** k for k in range(9) if mask & CELL_BITS[k]) for mask in range(1 << 9))
+
+
+def board_code(x_mask, o_mask):
+    """Return the base-3 code of a grid given its "x" and "o" bitmasks."""
+    return TERNARY[x_mask] + 2 * TERNARY[o_mask]
+
+
+def _build_code_tables():
+    cells = [None] * NUM_CODES
+    winner = [None] * NUM_CODES
+    for x_mask in range(1 << 9):
+        for o_mask in range(1 << 9):
+            if x_mask & o_mask:
+                continue
+            code = board_code(x_mask, o_mask)
+            cells[code] = ["x" if x_mask & b else "o" if o_mask & b else "" for b in CELL_BITS]
+            winner[code] = mask_winner(x_mask, o_mask)
+    return tuple(cells), tuple(winner)
+
+
+# Agent-independent tables: cell list and winner for every code
+CODE_CELLS, WINNER = _build_code_tables()
+
+
+class ScoreTables:
+    """score_board and calculate_square_importance for every code, for one agent profile."""
+
+    def __init__(self, agent_id='default'):
+        self.agent_id = agent_id
+
+        config = load_agent_config(agent_id=agent_id)
+        self.global_score_weight = float(config.get("global_score_weight", 0.65))
+        self.strategic_score_weight = float(config.get("strategic_score_weight", 0.35))
+        self.offensive_weight = float(config.get("offensive_weight", 0.7))
+        self.defensive_weight = float(config.get("defensive_weight", 0.3))
+        self.final_max_score = float(config.get("final_max_score", 0.9))
+
+        # score[player][code] == score_board(CODE_CELLS[code], player)
+        self.score = {
+            player: [score_board(cells, player, agent_id=agent_id) for cells in CODE_CELLS]
+            for player in ("x", "o")
+        }
+        # importance[code] == calculate_square_importance(CODE_CELLS[code])
+        self.importance = [calculate_square_importance(cells, agent_id=agent_id) for cells in CODE_CELLS]
+
+
+def get_score_tables(agent_id='default'):
+    """Return the tables for an agent profile, building them on first use.
+
+    Ids without a profile of their own share the default profile's tables.
+    """
+    return _cached_score_tables(_profile_id(agent_id))
+
+
+@functools.lru_cache(maxsize=None)
+def _profile_id(agent_id):
+    return agent_profile_id(agent_id)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_score_tables(agent_id):
+    return ScoreTables(agent_id=agent_id)
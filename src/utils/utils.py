@@ -40,3 +40,16 @@ def load_agent_config(agent_id="default"):
     if agent_id in config:
         return config[agent_id]
     return config["default"]
+
+
+def agent_profile_id(agent_id="default"):
+    """Id of the profile load_agent_config returns for `agent_id`: the id itself, or "default" if unknown."""
+    with open("./src/etc/agents_config.toml", "rb") as f:
+        config = toml.load(f)
+    return agent_id if agent_id in config else "default"
+
+
+def list_agent_ids():
+    """Ids of every agent profile in agents_config.toml, in file order."""
+    with open("./src/etc/agents_config.toml", "rb") as f:
+        return list(toml.load(f))
@@ -1,13 +1,18 @@
 from invoke import task
 
 @task
-def run_server(c, port=5000):
+def run_server(c, port=5000, workers=1, parallelism="root", ponder=True):
     """Run the Flask server.
 
     Args:
         port (int): Port number to run the server on (default: 5000)
+        workers (int): Search processes per move (default: 1)
+        parallelism (str): "root" for independent searches merged at the root,
+            "tree" for one tree shared in memory (default: "root")
+        ponder (bool): Search in the background on the human's turn (default: True)
     """
-    c.run(f"python src/flask_server.py --port {port}")
+    ponder_flag = "" if ponder else " --no-ponder"
+    c.run(f"python src/flask_server.py --port {port} --workers {workers} --parallelism {parallelism}{ponder_flag}")
 
 
 @task
@@ -25,6 +30,85 @@ def self_play(c, agent1="default", agent2="default", compute_time=5):
         env=env
     )
 
+@task
+def build_book(c, games="data/self_play_games", out="data/opening_book.bin", max_ply=12, search_plies=0,
+               search_seconds=0):
+    """Build the opening book from self-play games.
+
+    Args:
+        games (str): Directory of self-play games (default: 'data/self_play_games')
+        out (str): Book file to write (default: 'data/opening_book.bin')
+        max_ply (int): Deepest ply kept in the book (default: 12)
+        search_plies (int): Also search positions up to this ply offline (default: 0)
+        search_seconds (int): Seconds per offline search (default: 0, no searches)
+    """
+    env = {"PYTHONPATH": "src"}
+    c.run(
+        f"python -m ai.opening_book --games {games} --out {out} --max_ply {max_ply} "
+        f"--search_plies {search_plies} --search_seconds {search_seconds}",
+        env=env
+    )
+
+@task
+def tournament(c, name="tournament", agents="", mode="round_robin", challenger="", games=2, nodes=0, seconds=1.0,
+               workers=1, seed=0, records=""):
+    """Run (or resume) a tournament between agents and report Elo ratings.
+
+    Args:
+        name (str): Tournament name; reusing one resumes it (default: 'tournament')
+        agents (str): Comma-separated agent IDs (default: every agent in the config)
+        mode (str): "round_robin" or "gauntlet" (default: "round_robin")
+        challenger (str): Agent that plays every other agent in a gauntlet
+        games (int): Games per pairing, alternating colors (default: 2)
+        nodes (int): Search iterations per move, reproducible (default: 0, use seconds)
+        seconds (float): Seconds per move when no node budget is set (default: 1.0)
+        workers (int): Games played at once (default: 1)
+        seed (int): Base seed for the games' searches (default: 0)
+        records (str): Also append the games to this binary record directory (default: none)
+    """
+    env = {"PYTHONPATH": "src"}
+    options = f"--name {name} --mode {mode} --games {games} --seconds {seconds} --workers {workers} --seed {seed}"
+    if agents:
+        options += " --agents " + " ".join(agents.split(","))
+    if challenger:
+        options += f" --challenger {challenger}"
+    if nodes:
+        options += f" --nodes {nodes}"
+    if records:
+        options += f" --records {records}"
+    c.run(f"python -m core.tournament {options}", env=env)
+
+@task
+def benchmark(c, agent="default", nodes=2000, seed=0, repeat=3, tolerance=0.15, save=False):
+    """Benchmark the search on fixed positions and compare with the stored baseline.
+
+    Args:
+        agent (str): Agent ID to search with (default: 'default')
+        nodes (int): Root visits per position (default: 2000)
+        seed (int): Search seed (default: 0)
+        repeat (int): Timed runs per position; the fastest counts (default: 3)
+        tolerance (float): Relative slowdown that fails the run (default: 0.15)
+        save (bool): Save the results as the new baseline instead of comparing (default: False)
+    """
+    env = {"PYTHONPATH": "src"}
+    save_flag = " --save" if save else ""
+    c.run(
+        f"python -m core.benchmark --agent {agent} --nodes {nodes} --seed {seed} --repeat {repeat} "
+        f"--tolerance {tolerance}{save_flag}",
+        env=env
+    )
+
+@task
+def rebuild_index(c, data_dir="data/games"):
+    """Rebuild the game listing index of a game storage directory.
+
+    Args:
+        data_dir (str): Game storage directory (default: 'data/games')
+    """
+    env = {"PYTHONPATH": "src"}
+    c.run(f"python -m utils.game_storage rebuild-index --data_dir {data_dir}", env=env)
+
+
 @task
 def validate_config(c, agent="default"):
     """
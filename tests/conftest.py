@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def legacy_games_dir(tmp_path):
+    """A directory with one self-play game saved before visit counts were kept: root moves are [move, score]."""
+    moves_log = [
+        {"player": "o", "move": {"board": 4, "cell": 4},
+         "metadata": {"moves": [[[4, 4], 0.6], [[0, 0], 0.4]]}},
+        {"player": "x", "move": {"board": 4, "cell": 0},
+         "metadata": {"moves": [[[4, 0], 0.5]]}},
+    ]
+    game_data = {
+        "game_id": "selfplay_legacy",
+        "moves": [{"move_number": 1, "board": 4, "cell": 0, "player": "x", "metadata": moves_log}],
+        "current_state": {},
+        "snapshots": []
+    }
+    games_dir = tmp_path / "self_play_games"
+    games_dir.mkdir()
+    with open(games_dir / "selfplay_legacy.json", "w") as f:
+        json.dump(game_data, f)
+    return games_dir
@@ -0,0 +1,13 @@
+from utils.game_records import import_games, iter_records
+
+
+def test_import_legacy_game(legacy_games_dir, tmp_path):
+    records_dir = tmp_path / "records"
+    assert import_games(legacy_games_dir, directory=records_dir) == 1
+
+    records = list(iter_records(records_dir))
+    assert len(records) == 1
+    assert records[0].move_list() == [(4, 4), (4, 0)]
+    assert records[0].winner == ""
+    # Legacy root moves carry no visit counts, so no distributions
+    assert records[0].visits == [[], []]
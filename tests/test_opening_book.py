@@ -0,0 +1,11 @@
+from ai.opening_book import build_book
+from core.game import Game
+
+
+def test_build_book_from_legacy_game(legacy_games_dir):
+    positions = build_book(legacy_games_dir)
+
+    start = Game()
+    assert positions[start.position_hash()] == {(4, 4): [1, 0.6], (0, 0): [1, 0.4]}
+    start.make_move(4, 4, start.next_to_move)
+    assert positions[start.position_hash()] == {(4, 0): [1, 0.5]}